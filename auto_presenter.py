@@ -1,17 +1,74 @@
 from dotenv import load_dotenv
 import os
+import re
 import sys
 import subprocess # New import for running command-line tools
 import time
+import threading
+import queue
+import argparse
+import shutil
 import google.generativeai as genai
-from TTS.api import TTS # Using the high-quality offline TTS
+from tts_engines import create_tts_registry_from_env, DEFAULT_TTS_MODEL # Offline Coqui TTS behind a pluggable engine
+import numpy as np
 from moviepy.editor import ImageClip, AudioFileClip, concatenate_videoclips
+from PIL import Image
 import fitz # PyMuPDF
+from slide_content import analyze_slide_content, print_route_summary
+from slide_dedup import plan_deduplication, DEFAULT_THRESHOLD as DEFAULT_DEDUP_THRESHOLD
+from renditions import OUTPUT_PROFILES, encode_renditions, parse_profiles
+from cancellation import JobCancelled, CancellableLogger, check_cancelled, run_cancellable
 
 # --- CONFIGURATION ---
 load_dotenv()
 # Your Gemini API Key for script generation
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+# Coqui voice model and inference backend ("pytorch", "onnx" or "onnx-int8")
+TTS_MODEL_NAME = os.getenv("TTS_MODEL_NAME", DEFAULT_TTS_MODEL)
+TTS_BACKEND = os.getenv("TTS_BACKEND", "pytorch")
+# Upper bound on Gemini requests per minute (0 disables throttling)
+GEMINI_REQUESTS_PER_MINUTE = float(os.getenv("GEMINI_REQUESTS_PER_MINUTE", "0"))
+# Send extracted text instead of the slide image for text-only slides (set to 0 to disable)
+TEXT_FAST_PATH = os.getenv("TEXT_FAST_PATH", "1") != "0"
+# How near-identical slides are handled: "off", "reuse" or "merge" (see slide_dedup.py)
+SLIDE_DEDUP_POLICY = os.getenv("SLIDE_DEDUP_POLICY", "off")
+SLIDE_DEDUP_THRESHOLD = int(os.getenv("SLIDE_DEDUP_THRESHOLD", DEFAULT_DEDUP_THRESHOLD))
+# Draft preview settings (a slideshow needs very few frames per second)
+DRAFT_HEIGHT = int(os.getenv("DRAFT_HEIGHT", "360"))
+DRAFT_FPS = int(os.getenv("DRAFT_FPS", "4"))
+# Stream Gemini's script into TTS sentence by sentence (--stream on the command line)
+STREAMING_TTS = os.getenv("STREAMING_TTS", "0") == "1"
+
+# End of a sentence: terminal punctuation, optional closing quotes/brackets, then whitespace
+SENTENCE_BOUNDARY = re.compile(r'(?:(?<=[.!?])|(?<=[.!?]["\')\]]))\s+')
+# Follow-up requests made when a streamed script breaks off part-way
+STREAM_CONTINUATION_ATTEMPTS = 1
+
+
+class RateLimiter:
+    """
+    Spaces out calls so that at most ``requests_per_minute`` start per minute.
+    Thread-safe, so one limiter can be shared by every deck in a batch.
+    """
+
+    def __init__(self, requests_per_minute):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def acquire(self, cancel_token=None):
+        """Blocks until the caller may issue the next request."""
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if wait > 0:
+            if cancel_token is not None:
+                cancel_token.wait(wait)
+            else:
+                time.sleep(wait)
 
 
 def configure_gemini_vision_model(api_key):
@@ -108,11 +165,19 @@ def configure_gemini_vision_model(api_key):
         print(f"An error occurred during Gemini configuration: {e}")
         sys.exit(1)
 
+def get_slide_pdf_path(pptx_path, temp_folder):
+    """Returns where LibreOffice writes the PDF export of a presentation."""
+    pdf_filename = os.path.splitext(os.path.basename(pptx_path))[0] + ".pdf"
+    return os.path.join(temp_folder, pdf_filename)
+
 # --- NEW LINUX-COMPATIBLE FUNCTION ---
-def extract_slides_as_images_linux(pptx_path, temp_folder):
+def extract_slides_as_images_linux(pptx_path, temp_folder, profile_dir=None, cancel_token=None):
     """
     Converts PPTX slides to PNG images using LibreOffice on Linux.
     This replaces the PowerPoint dependency.
+    Pass a distinct profile_dir per worker to run several conversions at once;
+    LibreOffice refuses to start twice with the same user profile.
+    Cancelling cancel_token kills LibreOffice and stops the rasterization.
     """
     print("\nStep 1: Converting PPTX to images (using LibreOffice for PDF export)...")
     if not os.path.exists(temp_folder):
@@ -127,9 +192,11 @@ def extract_slides_as_images_linux(pptx_path, temp_folder):
             "--outdir", temp_folder,
             pptx_path
         ]
+        if profile_dir:
+            command.insert(1, f"-env:UserInstallation=file://{os.path.abspath(profile_dir)}")
         print(f"  - Running command: {' '.join(command)}")
         # Execute the command
-        subprocess.run(command, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        run_cancellable(command, cancel_token)
         print(f"  - Successfully converted PPTX to PDF using LibreOffice.")
     except (subprocess.CalledProcessError, FileNotFoundError) as e:
         print(f"  - Error during PDF conversion with LibreOffice: {e}")
@@ -137,8 +204,7 @@ def extract_slides_as_images_linux(pptx_path, temp_folder):
         return None
 
     # This part remains the same, as PyMuPDF is cross-platform
-    pdf_filename = os.path.splitext(os.path.basename(pptx_path))[0] + ".pdf"
-    pdf_path = os.path.join(temp_folder, pdf_filename)
+    pdf_path = get_slide_pdf_path(pptx_path, temp_folder)
     
     image_paths = []
     
@@ -152,6 +218,7 @@ def extract_slides_as_images_linux(pptx_path, temp_folder):
         
         doc = fitz.open(pdf_path)
         for i, page in enumerate(doc):
+            check_cancelled(cancel_token)
             pix = page.get_pixmap(dpi=300)
             image_path = os.path.join(temp_folder, f"slide_{i + 1}.png")
             pix.save(image_path)
@@ -165,20 +232,90 @@ def extract_slides_as_images_linux(pptx_path, temp_folder):
     print(f"  - Successfully extracted {len(image_paths)} slide images")
     return image_paths
 
-def generate_script_for_slide(vision_model, image_path, slide_number, total_slides):
-    """Generates a speaker script for a slide image using Gemini."""
-    print(f"\nStep 2: Generating script for slide {slide_number} (using Gemini)...")
+def analyze_presentation_content(pptx_path, temp_folder, label=None):
+    """
+    Mines the exported PDF and the PPTX speaker notes for per-slide text and
+    decides which slides can skip the image upload. Returns None when the
+    text fast path is disabled or the PDF cannot be read.
+    """
+    if not TEXT_FAST_PATH:
+        return None
     try:
+        contents = analyze_slide_content(get_slide_pdf_path(pptx_path, temp_folder), pptx_path)
+    except Exception as e:
+        print(f"  - Could not analyze slide text, using image prompts for every slide: {e}")
+        return None
+    print_route_summary(contents, label or os.path.basename(pptx_path))
+    return contents
+
+def plan_slide_deduplication(pptx_path, temp_folder, slide_contents=None):
+    """
+    Clusters near-identical slides of the exported PDF using perceptual hashes.
+    The slide text guards every cluster; it is taken from slide_contents when
+    available and read from the PDF otherwise (e.g. with TEXT_FAST_PATH=0).
+    Returns None when deduplication is off or the PDF cannot be hashed.
+    """
+    if SLIDE_DEDUP_POLICY == "off":
+        return None
+    texts = [c["text"] for c in slide_contents] if slide_contents else None
+    try:
+        plan = plan_deduplication(
+            get_slide_pdf_path(pptx_path, temp_folder), SLIDE_DEDUP_POLICY, SLIDE_DEDUP_THRESHOLD, texts
+        )
+    except Exception as e:
+        print(f"  - Could not deduplicate slides, processing every slide: {e}")
+        return None
+    plan.print_summary()
+    return plan
+
+def reuse_duplicate_slide(source_script_path, source_audio, script_path, audio_path, slide_num, source_num):
+    """
+    Copies the script and audio of an earlier near-identical slide. The copies
+    are ordinary per-slide files, so editing the duplicate's script later
+    regenerates only its own audio.
+    """
+    print(f"\n--- Slide {slide_num} duplicates slide {source_num}; reusing its script and audio ---")
+    script = load_script_from_file(source_script_path)
+    if not script or not source_audio or not os.path.exists(source_audio):
+        return None, None
+    if not save_script_to_file(script, script_path, slide_num):
+        return None, None
+    shutil.copyfile(source_audio, audio_path)  # Written after the script, so it is not stale
+    return script, audio_path
+
+def get_slide_context_prompt(slide_number, total_slides):
+    """Returns the position-aware part of the script prompt."""
+    if slide_number == 1:
+        return "This is the first slide of the presentation. You may greet the audience and introduce the topic."
+    elif slide_number == total_slides:
+        return "This is the final slide of the presentation. Thank the audience, summarize key takeaways, or provide a professional closing."
+    else:
+        return "This is a middle slide of the presentation. Continue the presentation flow without greetings or farewells."
+
+def build_script_prompt(image_path, slide_number, total_slides, slide_content=None):
+    """
+    Builds the Gemini prompt for a slide's script. Image-routed slides are
+    uploaded first; returns (prompt, uploaded file or None) and the caller
+    deletes the uploaded file when done.
+    """
+    text_only = bool(slide_content and slide_content.get("route") == "text")
+    
+    # Create context-aware prompts based on slide position
+    context_prompt = get_slide_context_prompt(slide_number, total_slides)
+    notes = slide_content.get("notes") if slide_content else None
+    
+    slide_image = None
+    if text_only:
+        prompt = [
+            "You are a professional presenter. Write a clear and engaging speaker script for a slide with the following text.",
+            context_prompt,
+            "Explain the key points as if presenting to an audience.",
+            "Do not read the bullet points verbatim or mention the slide itself. Deliver the information directly.",
+            "Keep the script under 150 words.",
+            f"Slide text:\n{slide_content['text']}",
+        ]
+    else:
         slide_image = genai.upload_file(image_path)
-        
-        # Create context-aware prompts based on slide position
-        if slide_number == 1:
-            context_prompt = "This is the first slide of the presentation. You may greet the audience and introduce the topic."
-        elif slide_number == total_slides:
-            context_prompt = "This is the final slide of the presentation. Thank the audience, summarize key takeaways, or provide a professional closing."
-        else:
-            context_prompt = "This is a middle slide of the presentation. Continue the presentation flow without greetings or farewells."
-        
         prompt = [
             "You are a professional presenter. Write a clear and engaging speaker script for this slide.",
             context_prompt,
@@ -187,21 +324,179 @@ def generate_script_for_slide(vision_model, image_path, slide_number, total_slid
             "Keep the script under 150 words.",
             slide_image
         ]
+    if notes:
+        prompt.insert(-1, f"Use the presenter's speaker notes as guidance:\n{notes}")
+    return prompt, slide_image
+
+def delete_uploaded_file(uploaded_file):
+    """Best-effort removal of a file uploaded to Gemini."""
+    if uploaded_file is None:
+        return
+    try:
+        genai.delete_file(uploaded_file.name)
+    except Exception:
+        pass
+
+def generate_script_for_slide(vision_model, image_path, slide_number, total_slides, rate_limiter=None, slide_content=None,
+                              cancel_token=None):
+    """
+    Generates a speaker script for a slide using Gemini.
+    When slide_content routes the slide to "text", the extracted slide text is
+    sent in a text-only prompt instead of uploading the image.
+    Raises JobCancelled if cancel_token is cancelled before the request is sent.
+    """
+    text_only = bool(slide_content and slide_content.get("route") == "text")
+    mode = "text-only prompt" if text_only else "image prompt"
+    print(f"\nStep 2: Generating script for slide {slide_number} (using Gemini, {mode})...")
+    slide_image = None
+    try:
+        check_cancelled(cancel_token)
+        if rate_limiter:
+            rate_limiter.acquire(cancel_token)
+        
+        prompt, slide_image = build_script_prompt(image_path, slide_number, total_slides, slide_content)
+        
+        check_cancelled(cancel_token)
         response = vision_model.generate_content(prompt)
         script = response.text.strip().replace("*", "")
         print(f"  - Script for slide {slide_number} generated successfully.")
-        genai.delete_file(slide_image.name)
         return script
     except Exception as e:
         print(f"  - Error generating script for slide {slide_number}: {e}")
         return None
+    finally:
+        delete_uploaded_file(slide_image)
+
+def split_complete_sentences(text):
+    """
+    Splits the complete sentences off the front of streamed ``text``.
+    Returns (sentences, remainder), where the remainder is still being written.
+    """
+    boundaries = list(SENTENCE_BOUNDARY.finditer(text))
+    if not boundaries:
+        return [], text
+    complete, remainder = text[:boundaries[-1].end()], text[boundaries[-1].end():]
+    sentences = [sentence.strip() for sentence in SENTENCE_BOUNDARY.split(complete) if sentence.strip()]
+    return sentences, remainder
 
-def synthesize_speech_with_coqui(tts_engine, text, output_path, slide_number):
-    """Converts text to a WAV audio file using the offline Coqui TTS engine."""
+def generate_script_and_audio_streaming(vision_model, tts_engine, image_path, script_path, audio_path,
+                                        slide_number, total_slides, rate_limiter=None, slide_content=None,
+                                        cancel_token=None, sentence_slot=None):
+    """
+    Generates a slide's script with a streamed Gemini response and starts TTS
+    on each sentence as soon as it is complete, while the rest of the script
+    is still being generated. Each sentence's audio is appended to a partial
+    WAV file as it is synthesized. If the stream breaks off, Gemini is asked
+    once to continue from the text received so far, so the narration already
+    synthesized is kept. The full script is saved with save_script_to_file
+    before the audio is moved into place, so the audio is not considered
+    stale. ``sentence_slot`` (a context manager factory) is held around the
+    synthesis of each sentence, for callers that limit TTS concurrency.
+    Returns (script, audio_path); either may be None.
+    """
+    text_only = bool(slide_content and slide_content.get("route") == "text")
+    mode = "text-only prompt" if text_only else "image prompt"
+    print(f"\nStep 2+3: Streaming script for slide {slide_number} into TTS (using Gemini, {mode})...")
+    
+    sentences = queue.Queue()
+    partial_audio_path = f"{audio_path}.partial"
+    synthesis = {}
+    
+    def discard_partial_audio():
+        if os.path.exists(partial_audio_path):
+            os.remove(partial_audio_path)
+    
+    def queued_sentences():
+        for sentence in iter(sentences.get, None):
+            if cancel_token is not None and cancel_token.cancelled:
+                return  # The audio is discarded anyway
+            yield sentence
+    
+    def synthesize_sentences():
+        try:
+            synthesis["path"] = tts_engine.synthesize_stream(queued_sentences(), partial_audio_path, sentence_slot)
+        except Exception as e:
+            synthesis["error"] = e
+    
+    worker = threading.Thread(target=synthesize_sentences, name=f"tts-stream-{slide_number}", daemon=True)
+    worker.start()
+    slide_image = None
+    script = None
+    try:
+        prompt = None
+        parts = []
+        pending = ""
+        for attempt in range(1 + STREAM_CONTINUATION_ATTEMPTS):
+            try:
+                check_cancelled(cancel_token)
+                if rate_limiter:
+                    rate_limiter.acquire(cancel_token)
+                if prompt is None:
+                    prompt, slide_image = build_script_prompt(image_path, slide_number, total_slides, slide_content)
+                request = prompt
+                if parts:
+                    request = prompt + [
+                        "The beginning of the script is already written below. Continue it exactly "
+                        "where it stops, without repeating any of it:\n" + "".join(parts)
+                    ]
+                
+                check_cancelled(cancel_token)
+                response = vision_model.generate_content(request, stream=True)
+                continuing = bool(parts)
+                for chunk in response:
+                    check_cancelled(cancel_token)
+                    text = chunk.text.replace("*", "")
+                    if continuing:
+                        # The continuation restarts mid-text; keep one space at the seam
+                        text = text.lstrip()
+                        if text and not "".join(parts)[-1:].isspace():
+                            text = " " + text
+                        continuing = not text
+                    parts.append(text)
+                    complete, pending = split_complete_sentences(pending + text)
+                    for sentence in complete:
+                        sentences.put(sentence)
+                break
+            except Exception as e:
+                if attempt == STREAM_CONTINUATION_ATTEMPTS:
+                    raise
+                print(f"  - Script stream for slide {slide_number} broke off ({e}); continuing from the received text...")
+        if pending.strip():
+            sentences.put(pending.strip())
+        script = "".join(parts).strip()
+        print(f"  - Script for slide {slide_number} generated successfully.")
+    except Exception as e:
+        print(f"  - Error generating script for slide {slide_number}: {e}")
+        script = None
+    finally:
+        sentences.put(None)
+        worker.join()
+        delete_uploaded_file(slide_image)
+        if script is None:
+            discard_partial_audio()  # Also on cancellation
+    
+    if not script or not save_script_to_file(script, script_path, slide_number):
+        discard_partial_audio()
+        return None, None
+    if synthesis.get("error") is not None or synthesis.get("path") is None:
+        print(f"  - Error synthesizing speech for slide {slide_number}: {synthesis.get('error')}")
+        discard_partial_audio()
+        return script, None
+    os.replace(partial_audio_path, audio_path)
+    os.utime(audio_path)  # Newer than the script saved above
+    print(f"  - Audio file saved: {audio_path}")
+    return script, audio_path
+
+def synthesize_speech_with_coqui(tts_engine, text, output_path, slide_number, cancel_token=None):
+    """
+    Converts text to a WAV audio file using the offline Coqui TTS engine.
+    Any engine from tts_engines (PyTorch, ONNX, int8 ONNX) can be passed in.
+    """
     print(f"Step 3: Synthesizing audio for slide {slide_number} (using local Coqui TTS)...")
     if not text:
         print("  - Skipping audio synthesis due to empty script.")
         return None
+    check_cancelled(cancel_token)
     try:
         print(f"  - Starting TTS synthesis for slide {slide_number}...")
         # Use tts method instead of to_file
@@ -221,23 +516,43 @@ def synthesize_speech_with_coqui(tts_engine, text, output_path, slide_number):
         print(f"  - Error type: {type(e).__name__}")
         return None
 
-def create_video_with_moviepy(image_files, audio_files, output_path):
-    """Creates a video by combining slide images and audio narrations using moviepy."""
+def create_video_with_moviepy(image_files, audio_files, output_path, fps=24, height=None, preset=None, ffmpeg_params=None,
+                              cancel_token=None, work_dir=None):
+    """
+    Creates a video by combining slide images and audio narrations using moviepy.
+    The file is written under a temporary name and moved into place only once
+    complete, so readers never see a half-written video. MoviePy's temporary
+    audio track goes to work_dir (default: next to the output).
+    Returns output_path on success, None otherwise. Cancelling cancel_token
+    stops the encode at the next frame and raises JobCancelled.
+    """
     print("\nStep 4: Creating video from images and audio with moviepy...")
+    partial_path = os.path.splitext(output_path)[0] + ".partial.mp4"
+    temp_audio_path = os.path.splitext(output_path)[0] + '_temp-audio.m4a'
+    if work_dir:
+        temp_audio_path = os.path.join(work_dir, os.path.basename(temp_audio_path))
+    logger = CancellableLogger(cancel_token) if cancel_token is not None else None
     clips = []
+    segments = {}  # (image, audio) -> clip, so duplicate slides share one decoded segment
     for img_path, audio_path in zip(image_files, audio_files):
+        check_cancelled(cancel_token)
         if not os.path.exists(img_path):
             print(f"  - Warning: Missing image {img_path}. Skipping slide.")
             continue
         if not audio_path or not os.path.exists(audio_path):
             print(f"  - Warning: Missing audio for {os.path.basename(img_path)}. Skipping slide.")
             continue
+        if (img_path, audio_path) in segments:
+            clips.append(segments[(img_path, audio_path)])
+            print(f"  - Reused segment: {os.path.basename(img_path)}")
+            continue
         try:
             audio_clip = AudioFileClip(audio_path)
-            image_clip = ImageClip(img_path)
+            image_clip = ImageClip(scaled_frame(img_path, height) if height else img_path)
             image_clip = image_clip.set_duration(audio_clip.duration)
             video_clip = image_clip.set_audio(audio_clip)
             clips.append(video_clip)
+            segments[(img_path, audio_path)] = video_clip
             print(f"  - Processed slide: {os.path.basename(img_path)}")
         except Exception as e:
             print(f"  - Error processing clip for {os.path.basename(img_path)}: {e}")
@@ -245,88 +560,181 @@ def create_video_with_moviepy(image_files, audio_files, output_path):
     if not clips:
         print("  - No clips were created. Cannot generate video.")
         print("  - This is likely due to TTS synthesis failures. Check the TTS errors above.")
-        return
+        return None
 
     print(f"  - Created {len(clips)} video clips successfully")
     final_video = concatenate_videoclips(clips)
     
+    # The fallback encodes can be cancelled too; every path cleans up its partial output
     try:
-        print(f"  - Writing video file: {output_path}")
-        # Use more compatible settings for containerized environments
-        final_video.write_videofile(
-            output_path, 
-            fps=24, 
-            codec='libx264',
-            audio_codec='aac',
-            temp_audiofile='temp-audio.m4a',
-            remove_temp=True,
-            verbose=False,
-            logger=None
-        )
-        print(f"\nVideo successfully created: {output_path}")
-        
-        # Verify the file was created and has content
-        if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
-            print(f"  - Video file size: {os.path.getsize(output_path)} bytes")
-        else:
-            print("  - Warning: Video file appears to be empty or missing")
-            
-    except Exception as e:
-        print(f"\nError writing final video file: {e}")
-        
-        # Remove the failed file if it exists
-        if os.path.exists(output_path):
-            try:
-                os.remove(output_path)
-                print(f"  - Removed failed video file: {output_path}")
-            except:
-                pass
-        
-        print("  - Trying alternative H.264 method...")
-        
-        # Try H.264 with simpler settings - overwrite original file
         try:
+            print(f"  - Writing video file: {output_path}")
+            # Use more compatible settings for containerized environments
             final_video.write_videofile(
-                output_path,
-                fps=24,
+                partial_path, 
+                fps=fps, 
                 codec='libx264',
-                preset='ultrafast',  # Faster encoding, larger file
+                audio_codec='aac',
+                # Per-output temp file so concurrent encodes do not clobber each other
+                temp_audiofile=temp_audio_path,
+                remove_temp=True,
+                preset=preset or 'medium',
+                ffmpeg_params=ffmpeg_params,
                 verbose=False,
-                logger=None
+                logger=logger
             )
-            print(f"Video successfully created with alternative H.264 settings: {output_path}")
-        except Exception as e2:
-            print(f"H.264 alternative failed: {e2}")
-            print("  - Falling back to MP4V...")
-            
+            os.replace(partial_path, output_path)
+            print(f"\nVideo successfully created: {output_path}")
+        
+            # Verify the file was created and has content
+            if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
+                print(f"  - Video file size: {os.path.getsize(output_path)} bytes")
+            else:
+                print("  - Warning: Video file appears to be empty or missing")
+            return output_path
+    
+        except Exception as e:
+            print(f"\nError writing final video file: {e}")
+        
             # Remove the failed file if it exists
-            if os.path.exists(output_path):
+            if os.path.exists(partial_path):
                 try:
-                    os.remove(output_path)
-                    print(f"  - Removed failed video file: {output_path}")
+                    os.remove(partial_path)
+                    print(f"  - Removed failed video file: {partial_path}")
                 except:
                     pass
-            
-            # Final fallback to MP4V - still use original filename
+        
+            print("  - Trying alternative H.264 method...")
+        
+            # Try H.264 with simpler settings - overwrite original file
             try:
                 final_video.write_videofile(
-                    output_path,
-                    fps=24,
-                    codec='mpeg4',
+                    partial_path,
+                    fps=fps,
+                    codec='libx264',
+                    preset='ultrafast',  # Faster encoding, larger file
                     verbose=False,
-                    logger=None
+                    logger=logger
                 )
-                print(f"Video successfully created with MP4V codec: {output_path}")
-            except Exception as e3:
-                print(f"All encoding methods failed: {e3}")
-                print(f"Could not create video file: {output_path}")
+                os.replace(partial_path, output_path)
+                print(f"Video successfully created with alternative H.264 settings: {output_path}")
+                return output_path
+            except Exception as e2:
+                print(f"H.264 alternative failed: {e2}")
+                print("  - Falling back to MP4V...")
+            
+                # Remove the failed file if it exists
+                if os.path.exists(partial_path):
+                    try:
+                        os.remove(partial_path)
+                        print(f"  - Removed failed video file: {partial_path}")
+                    except:
+                        pass
+            
+                # Final fallback to MP4V - still use original filename
+                try:
+                    final_video.write_videofile(
+                        partial_path,
+                        fps=fps,
+                        codec='mpeg4',
+                        verbose=False,
+                        logger=logger
+                    )
+                    os.replace(partial_path, output_path)
+                    print(f"Video successfully created with MP4V codec: {output_path}")
+                    return output_path
+                except Exception as e3:
+                    print(f"All encoding methods failed: {e3}")
+                    print(f"Could not create video file: {output_path}")
+                    if os.path.exists(partial_path):
+                        os.remove(partial_path)
+                    return None
+    except JobCancelled:
+        print(f"  - Video encode cancelled: {output_path}")
+        for path in (partial_path, temp_audio_path):
+            if os.path.exists(path):
+                os.remove(path)
+        raise
     
     finally:
         # Clean up clips to free memory
-        for clip in clips:
+        for clip in segments.values():
             clip.close()
         final_video.close()
 
+def scaled_frame(image_path, height):
+    """
+    Loads a slide image scaled to ``height`` pixels as an RGB array. Done in
+    Pillow (LANCZOS) because MoviePy 1.0.3's resize needs OpenCV or
+    Image.ANTIALIAS, which Pillow 10 removed.
+    """
+    with Image.open(image_path) as image:
+        image = image.convert("RGB")
+        # libx264 needs even dimensions
+        width = max(2, int(round(image.width * height / image.height / 2)) * 2)
+        return np.asarray(image.resize((width, height), Image.LANCZOS))
+
+def create_draft_video(image_files, audio_files, output_path, cancel_token=None, work_dir=None):
+    """
+    Quickly renders a low-resolution, low-fps preview of the video so it can
+    be reviewed while the full-quality render is still running.
+    """
+    print("\n--- Rendering draft preview ---")
+    draft = create_video_with_moviepy(
+        image_files, audio_files, output_path,
+        fps=DRAFT_FPS,
+        height=DRAFT_HEIGHT,
+        preset='ultrafast',
+        ffmpeg_params=['-crf', '30', '-tune', 'stillimage'],
+        cancel_token=cancel_token,
+        work_dir=work_dir
+    )
+    if not draft:
+        print("  - Warning: Draft preview could not be rendered; see the errors above.")
+    return draft
+
+def render_final_outputs(image_files, audio_files, video_output_path, profiles=None, cancel_token=None, work_dir=None):
+    """
+    Renders the final video. Without profiles this is the MoviePy render; with
+    profiles every rendition (and the audio-only track) is encoded in one
+    ffmpeg pass and the largest video rendition doubles as the main video.
+    Returns (main video path or None, {profile: path}).
+    """
+    if not profiles:
+        return create_video_with_moviepy(
+            image_files, audio_files, video_output_path, cancel_token=cancel_token, work_dir=work_dir
+        ), {}
+    
+    renditions = encode_renditions(
+        image_files, audio_files, video_output_path, profiles, cancel_token=cancel_token, work_dir=work_dir
+    )
+    video_profiles = [p for p in renditions if not OUTPUT_PROFILES[p].get("audio_only")]
+    if not video_profiles:
+        return None, renditions
+    
+    largest = max(video_profiles, key=lambda p: OUTPUT_PROFILES[p]["height"])
+    partial_path = os.path.splitext(video_output_path)[0] + ".partial.mp4"
+    if os.path.exists(partial_path):
+        os.remove(partial_path)
+    try:
+        os.link(renditions[largest], partial_path)  # Same bytes, no extra disk space
+    except OSError:
+        shutil.copyfile(renditions[largest], partial_path)
+    os.replace(partial_path, video_output_path)
+    print(f"\nVideo successfully created: {video_output_path} ({largest})")
+    return video_output_path, renditions
+
+def lower_thread_priority(niceness=10):
+    """
+    Lowers the scheduling priority of the calling thread (Linux) so that a
+    background render, and the ffmpeg process it spawns, yields the CPU to
+    interactive work.
+    """
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), niceness)
+    except (AttributeError, OSError) as e:
+        print(f"  - Could not lower render priority: {e}")
+
 def save_script_to_file(script, script_path, slide_number):
     """Saves the generated script to a text file."""
     try:
@@ -361,24 +769,46 @@ def should_regenerate_audio(script_path, audio_path):
     
     return script_mtime > audio_mtime  # Regenerate if script is newer
 
-def main():
-    if len(sys.argv) < 2:
-        print("Usage: python auto_presenter.py <path_to_presentation.pptx>")
-        print("Example: python auto_presenter.py my_presentation.pptx")
-        sys.exit(1)
+def get_or_generate_script(vision_model, img_path, script_path, slide_num, total_slides, rate_limiter=None, slide_content=None):
+    """Loads the saved script for a slide, or generates and saves a new one."""
+    script = None
+    if os.path.exists(script_path):
+        print(f"\n--- Loading existing script for slide {slide_num} ---")
+        script = load_script_from_file(script_path)
+        if script:
+            print(f"  - Script loaded from: {script_path}")
+            print(f"  - Script preview: {script[:100]}..." if len(script) > 100 else f"  - Script: {script}")
+        else:
+            print("  - Failed to load script, will generate new one")
     
-    vision_model = configure_gemini_vision_model(GEMINI_API_KEY)
+    if not script:
+        script = generate_script_for_slide(
+            vision_model, img_path, slide_num, total_slides, rate_limiter, slide_content
+        )
+        if script:
+            save_script_to_file(script, script_path, slide_num)
+            print(f"  - Generated script: {script[:100]}..." if len(script) > 100 else f"  - Generated script: {script}")
+    return script
+
+def get_or_synthesize_audio(tts_engine, script, script_path, audio_path, slide_num):
+    """Returns the slide's audio file, synthesizing it if missing or outdated."""
+    if not script:
+        print(f"  - No script available for slide {slide_num}")
+        return None
     
-    print("\n--- Initializing Local Coqui TTS Engine ---")
-    print("This may take a moment and will download model files on the first run...")
-    try:
-        tts_engine = TTS("tts_models/en/ljspeech/vits")
-        print("--- Coqui TTS Engine Initialized Successfully ---")
-    except Exception as e:
-        print(f"Error initializing Coqui TTS: {e}")
-        sys.exit(1)
+    if should_regenerate_audio(script_path, audio_path):
+        if os.path.exists(audio_path):
+            print(f"  - Script modified, regenerating audio for slide {slide_num}")
+        else:
+            print(f"Step 3: Synthesizing audio for slide {slide_num} (using local Coqui TTS)...")
+        return synthesize_speech_with_coqui(tts_engine, script, audio_path, slide_num)
+    
+    print(f"\n--- Audio for slide {slide_num} is up to date. Skipping synthesis. ---")
+    return audio_path
 
-    input_pptx = os.path.abspath(sys.argv[1])
+def resolve_pptx_path(path):
+    """Validates a .pptx path, printing a helpful message and returning None if invalid."""
+    input_pptx = os.path.abspath(path)
     
     # Better file validation
     if not os.path.exists(input_pptx):
@@ -392,12 +822,66 @@ def main():
                 print(f"Did you mean: {suggested_path}?")
             else:
                 print("Note: The file should have a .pptx extension")
-        sys.exit(1)
+        return None
     
     # Check file extension
     if not input_pptx.lower().endswith('.pptx'):
         print(f"Error: Expected a PowerPoint file (.pptx), but got: {input_pptx}")
         print("This script only works with PowerPoint (.pptx) files.")
+        return None
+    return input_pptx
+
+def parse_args(argv=None):
+    """Parses the command line for single-deck mode (batch mode is batch_presenter.py)."""
+    parser = argparse.ArgumentParser(
+        description="Convert PowerPoint presentations into narrated videos.",
+        epilog="Example: python auto_presenter.py my_presentation.pptx"
+    )
+    parser.add_argument("presentation", nargs="?", help="Path to a .pptx file")
+    parser.add_argument("--draft", action="store_true",
+                        help="Render a quick low-resolution preview before the full-quality video")
+    parser.add_argument("--profiles", metavar="LIST",
+                        help=f"Comma-separated output profiles encoded in one pass ({', '.join(OUTPUT_PROFILES)})")
+    parser.add_argument("--stream", action="store_true", default=STREAMING_TTS,
+                        help="Stream each new script into TTS sentence by sentence while it is generated")
+    args = parser.parse_args(argv)
+    try:
+        args.profiles = parse_profiles(args.profiles)
+    except ValueError as e:
+        parser.error(str(e))
+    if not args.presentation:
+        print("Usage: python auto_presenter.py <path_to_presentation.pptx>")
+        print("       python batch_presenter.py <directory_or_manifest>")
+        sys.exit(1)
+    return args
+
+def init_pipeline():
+    """
+    Configures Gemini and loads the default TTS voice for the command-line
+    tools. Returns (vision_model, tts_engine, rate_limiter); exits if TTS
+    cannot start.
+    """
+    vision_model = configure_gemini_vision_model(GEMINI_API_KEY)
+    
+    print("\n--- Initializing Local Coqui TTS Engine ---")
+    print("This may take a moment and will download model files on the first run...")
+    print(f"  - Model: {TTS_MODEL_NAME} (backend: {TTS_BACKEND})")
+    try:
+        tts_registry = create_tts_registry_from_env(TTS_MODEL_NAME, TTS_BACKEND)
+        tts_engine = tts_registry.get()
+        print("--- Coqui TTS Engine Initialized Successfully ---")
+    except Exception as e:
+        print(f"Error initializing Coqui TTS: {e}")
+        sys.exit(1)
+
+    return vision_model, tts_engine, RateLimiter(GEMINI_REQUESTS_PER_MINUTE)
+
+def main():
+    args = parse_args()
+    vision_model, tts_engine, rate_limiter = init_pipeline()
+
+    input_pptx = resolve_pptx_path(args.presentation)
+    if not input_pptx:
         sys.exit(1)
         
     base_dir = os.path.dirname(input_pptx)
@@ -408,6 +892,8 @@ def main():
     slide_images = extract_slides_as_images_linux(input_pptx, temp_dir)
     if not slide_images:
         sys.exit(1)
+    slide_contents = analyze_presentation_content(input_pptx, temp_dir)
+    dedup_plan = plan_slide_deduplication(input_pptx, temp_dir, slide_contents)
 
     audio_files = []
     successful_audio_count = 0
@@ -420,42 +906,45 @@ def main():
         audio_path = os.path.join(temp_dir, f"audio_{slide_num}.wav")
         script_path = os.path.join(temp_dir, f"script_{slide_num}.txt")
 
-        # Load existing script or generate new one
-        script = None
-        if os.path.exists(script_path):
-            print(f"\n--- Loading existing script for slide {slide_num} ---")
-            script = load_script_from_file(script_path)
-            if script:
-                print(f"  - Script loaded from: {script_path}")
-                print(f"  - Script preview: {script[:100]}..." if len(script) > 100 else f"  - Script: {script}")
-            else:
-                print(f"  - Failed to load script, will generate new one")
-        
-        if not script:
-            script = generate_script_for_slide(vision_model, img_path, slide_num, len(slide_images))
-            if script:
-                save_script_to_file(script, script_path, slide_num)
-                print(f"  - Generated script: {script[:100]}..." if len(script) > 100 else f"  - Generated script: {script}")
+        # Merged animation build steps are narrated by their final slide
+        if dedup_plan and dedup_plan.is_dropped(i):
+            print(f"\n--- Slide {slide_num} is a build step of slide {dedup_plan.source_of(i) + 1}; merged ---")
+            audio_files.append(None)
+            continue
 
-        # Check if we need to regenerate audio
-        if script:
-            if should_regenerate_audio(script_path, audio_path):
-                if os.path.exists(audio_path):
-                    print(f"  - Script modified, regenerating audio for slide {slide_num}")
-                else:
-                    print(f"Step 3: Synthesizing audio for slide {slide_num} (using local Coqui TTS)...")
-                
-                synthesized_audio = synthesize_speech_with_coqui(tts_engine, script, audio_path, slide_num)
-                if synthesized_audio:
-                    successful_audio_count += 1
-                audio_files.append(synthesized_audio)
-            else:
-                print(f"\n--- Audio for slide {slide_num} is up to date. Skipping synthesis. ---")
-                audio_files.append(audio_path)
+        # Near-identical slides reuse the earlier slide's script and audio
+        source = dedup_plan.source_of(i) if dedup_plan else i
+        if source != i and not os.path.exists(script_path) and audio_files[source]:
+            source_script_path = os.path.join(temp_dir, f"script_{source + 1}.txt")
+            script, audio_file = reuse_duplicate_slide(
+                source_script_path, audio_files[source], script_path, audio_path, slide_num, source + 1
+            )
+            if audio_file:
                 successful_audio_count += 1
-        else:
-            print(f"  - No script available for slide {slide_num}")
-            audio_files.append(None)
+                audio_files.append(audio_file)
+                continue
+
+        slide_content = slide_contents[i] if slide_contents and i < len(slide_contents) else None
+
+        # New scripts can be streamed straight into TTS
+        audio_file = None
+        if args.stream and not os.path.exists(script_path):
+            script, audio_file = generate_script_and_audio_streaming(
+                vision_model, tts_engine, img_path, script_path, audio_path,
+                slide_num, len(slide_images), rate_limiter, slide_content
+            )
+
+        if not audio_file:
+            # Load existing script or generate new one
+            script = get_or_generate_script(
+                vision_model, img_path, script_path, slide_num, len(slide_images), rate_limiter, slide_content
+            )
+
+            # Check if we need to regenerate audio
+            audio_file = get_or_synthesize_audio(tts_engine, script, script_path, audio_path, slide_num)
+        if audio_file:
+            successful_audio_count += 1
+        audio_files.append(audio_file)
 
     print(f"\n--- Audio Generation Summary ---")
     print(f"  - Total slides: {len(slide_images)}")
@@ -473,7 +962,19 @@ def main():
 
     video_output_path = os.path.abspath(os.path.join(base_dir, f"{file_name}_presentation.mp4"))
     print(f"\n--- Starting Video Creation ---")
-    create_video_with_moviepy(slide_images, audio_files, video_output_path)
+    video_images, video_audio = dedup_plan.segment_sources(slide_images, audio_files) if dedup_plan else (slide_images, audio_files)
+    if args.draft:
+        draft_output_path = os.path.abspath(os.path.join(base_dir, f"{file_name}_draft.mp4"))
+        if create_draft_video(video_images, video_audio, draft_output_path, work_dir=temp_dir):
+            print(f"  - Draft preview ready: {draft_output_path}")
+        else:
+            print("  - Continuing with the full-quality render without a draft.")
+    video_file, renditions = render_final_outputs(
+        video_images, video_audio, video_output_path, args.profiles, work_dir=temp_dir
+    )
+    if not video_file and not renditions:
+        print("Error: No video or audio output was created.")
+        sys.exit(1)
         
     print("\nProcess finished successfully!")
 
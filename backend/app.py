@@ -6,12 +6,15 @@ Provides REST API endpoints for the conversion service.
 import os
 import uuid
 import asyncio
+import hashlib
 import json
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from contextlib import ExitStack, asynccontextmanager
 from typing import Dict, List, Optional
 from pathlib import Path
 
-from fastapi import FastAPI, File, UploadFile, HTTPException, BackgroundTasks
+from fastapi import FastAPI, File, Form, UploadFile, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse
 from pydantic import BaseModel
@@ -19,15 +22,30 @@ from pydantic import BaseModel
 # Import our existing conversion logic
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from auto_presenter import (
     configure_gemini_vision_model,
     extract_slides_as_images_linux,
+    analyze_presentation_content,
+    plan_slide_deduplication,
+    reuse_duplicate_slide,
     generate_script_for_slide,
+    generate_script_and_audio_streaming,
     synthesize_speech_with_coqui,
-    create_video_with_moviepy,
+    render_final_outputs,
+    create_draft_video,
+    lower_thread_priority,
     save_script_to_file,
     load_script_from_file,
-    should_regenerate_audio
+    should_regenerate_audio,
+    STREAMING_TTS
+)
+from renditions import OUTPUT_PROFILES, parse_profiles, rendition_path
+from slide_content import count_slides
+from scheduler import JobScheduler, QuotaExceeded, PRIORITY_CLASSES
+from cancellation import CancelToken, JobCancelled, check_cancelled
+from workspace import (
+    WorkspaceManager, DEFAULT_SCRATCH_TTL, DEFAULT_JOB_TTL, DEFAULT_DISK_BUDGET_MB, DEFAULT_GC_INTERVAL
 )
 
 # Load environment variables
@@ -51,21 +69,70 @@ app.add_middleware(
 
 # Global variables for services
 vision_model = None
-tts_engine = None
+tts_registry = None  # Loads voices on demand and shares them between jobs
 
 # Job storage (in production, use a proper database)
 jobs: Dict[str, Dict] = {}
 
+# Single-flight: upload key (content hash + voice + profiles) -> active job_id,
+# so identical concurrent uploads share one conversion
+inflight_uploads: Dict[str, str] = {}
+
+# Full-quality renders run one at a time at lowered priority so drafts stay fast
+final_render_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="final-render")
+
+# Admission control: bounded concurrency, priorities, fairness and per-client quotas
+scheduler = JobScheduler(
+    max_running_jobs=int(os.getenv("MAX_RUNNING_JOBS", "2")),
+    stage_limits={
+        "convert": int(os.getenv("MAX_CONVERT_WORKERS", "2")),
+        "script": int(os.getenv("MAX_SCRIPT_WORKERS", "4")),
+        "tts": int(os.getenv("MAX_TTS_WORKERS", "1")),
+    },
+    max_running_per_client=int(os.getenv("MAX_RUNNING_JOBS_PER_CLIENT", "1")),
+    max_queued_per_client=int(os.getenv("MAX_QUEUED_JOBS_PER_CLIENT", "10")),
+)
+
+# Per-job scratch (tmpfs by default) for intermediates, persistent storage for
+# uploads, videos and cached scripts/narrations, with TTL and disk-budget GC
+workspace = WorkspaceManager(
+    persistent_root=os.getenv("WORKSPACE_PERSISTENT_DIR", "uploads"),
+    scratch_root=os.getenv("WORKSPACE_SCRATCH_DIR") or None,
+    scratch_ttl=float(os.getenv("WORKSPACE_SCRATCH_TTL", DEFAULT_SCRATCH_TTL)),
+    job_ttl=float(os.getenv("WORKSPACE_JOB_TTL", DEFAULT_JOB_TTL)),
+    disk_budget_mb=float(os.getenv("WORKSPACE_DISK_BUDGET_MB", DEFAULT_DISK_BUDGET_MB)),
+)
+WORKSPACE_GC_INTERVAL = float(os.getenv("WORKSPACE_GC_INTERVAL", DEFAULT_GC_INTERVAL))
+
+# What happens to a cancelled conversion's files: "delete" removes the job
+# directory, "keep" leaves finished slides, scripts and narrations in place.
+# Half-written outputs are always removed.
+CANCELLED_ARTIFACTS = os.getenv("CANCELLED_ARTIFACTS", "delete")
+PARTIAL_ARTIFACT_PATTERNS = ("*.partial.*", "*_temp-audio.m4a", "*.ffconcat")
+# Longest time cleanup waits for a stage thread that could not be interrupted
+CANCEL_CLEANUP_TIMEOUT = float(os.getenv("CANCEL_CLEANUP_TIMEOUT", "60"))
+
 # Data models
 class JobStatus(BaseModel):
     job_id: str
-    status: str  # "pending", "processing", "completed", "failed"
+    status: str  # "pending", "processing", "completed", "failed", "cancelling", "cancelled"
     progress: int  # 0-100
     message: str
     created_at: datetime
     slides_total: Optional[int] = None
     slides_processed: Optional[int] = None
     video_url: Optional[str] = None
+    draft_video_url: Optional[str] = None  # Low-resolution preview, available before video_url
+    profiles: Optional[List[str]] = None  # Requested output profiles, e.g. ["1080p", "audio"]
+    renditions: Optional[Dict[str, str]] = None  # profile -> download URL
+    priority: Optional[str] = None  # "high", "normal" or "low"
+    queue_position: Optional[int] = None  # 1-based while waiting for a slot
+    eta_seconds: Optional[float] = None  # Estimated seconds until done
+    voice: Optional[str] = None
+    text_slides: Optional[int] = None  # Slides scripted from extracted text only
+    image_slides: Optional[int] = None  # Slides scripted from the uploaded image
+    duplicate_slides: Optional[int] = None  # Slides reusing or merged into another slide
+    coalesced_requests: Optional[int] = None  # Identical uploads or script edits merged into this job
 
 class ScriptUpdate(BaseModel):
     scripts: Dict[int, str]  # slide_number -> script_text
@@ -78,7 +145,7 @@ class SlideScript(BaseModel):
 # Initialize AI services on startup
 @app.on_event("startup")
 async def startup_event():
-    global vision_model, tts_engine
+    global vision_model, tts_registry
     
     print("Initializing AI services...")
     
@@ -93,17 +160,21 @@ async def startup_event():
         except Exception as e:
             print(f"Failed to initialize Gemini: {e}")
     
-    # Initialize TTS Engine
+    # Initialize TTS voice registry and warm up the default voice
     try:
-        from TTS.api import TTS
-        tts_engine = TTS("tts_models/en/ljspeech/vits")
-        print("✓ Coqui TTS Engine initialized")
+        from tts_engines import create_tts_registry_from_env
+        tts_registry = create_tts_registry_from_env()
+        tts_registry.get()
+        print(f"✓ Coqui TTS Engine initialized ({tts_registry.backend} backend)")
     except ImportError:
         print("⚠️  TTS library not available - install TTS for audio generation")
-        tts_engine = None
+        tts_registry = None
     except Exception as e:
         print(f"Failed to initialize TTS: {e}")
-        tts_engine = None
+        tts_registry = None
+    
+    print(f"✓ Workspace scratch at {workspace.scratch_root}")
+    asyncio.create_task(workspace_gc_loop())
 
 @app.get("/")
 async def root():
@@ -118,15 +189,78 @@ async def health_check():
     return {
         "status": "healthy",
         "gemini_available": vision_model is not None,
-        "tts_available": tts_engine is not None
+        "tts_available": tts_registry is not None,
+        "tts_loaded_voices": tts_registry.loaded_voices() if tts_registry else [],
+        "scheduler": scheduler.stats()
     }
 
+@app.get("/workspace")
+async def workspace_stats():
+    """Disk usage of the job workspaces and garbage collection metrics."""
+    return await asyncio.get_running_loop().run_in_executor(None, workspace.stats)
+
+@app.get("/voices")
+async def list_voices():
+    """List the voices jobs can choose from."""
+    if tts_registry is None:
+        return {"default": None, "voices": [], "loaded": []}
+    return {
+        "default": tts_registry.default_voice,
+        "voices": tts_registry.allowed_voices,
+        "loaded": tts_registry.loaded_voices()
+    }
+
+def upload_coalescing_key(content: bytes, voice: Optional[str], profiles: List[str]) -> str:
+    """Uploads with the same key would produce identical output."""
+    digest = hashlib.sha256(content).hexdigest()
+    return f"{digest}:{voice or ''}:{','.join(profiles)}"
+
+def release_upload_key(job: Dict):
+    """Stops routing identical uploads to ``job`` once its conversion has ended."""
+    key = job.get("upload_key")
+    if key and inflight_uploads.get(key) == job["job_id"]:
+        del inflight_uploads[key]
+
+def client_id_for(request: Request) -> str:
+    """Identifies the submitting client for quotas (X-Client-Id header, else IP)."""
+    return request.headers.get("X-Client-Id") or (request.client.host if request.client else "anonymous")
+
+def detach_client(job: Dict, request: Request) -> bool:
+    """
+    Handles a cancel or delete from one of the clients sharing a job through
+    coalesced uploads. While other uploads are attached, the caller is only
+    detached and False is returned; the last one attached gets True and may
+    really cancel or delete the job. Clients that never uploaded it get a 403.
+    """
+    attached = job["attached_clients"]
+    client_id = client_id_for(request)
+    if client_id not in attached:
+        raise HTTPException(status_code=403, detail="Job belongs to another client")
+    if sum(attached.values()) == 1:
+        return True
+    attached[client_id] -= 1
+    if not attached[client_id]:
+        del attached[client_id]
+    return False
+
+def job_status(job: Dict) -> JobStatus:
+    """Builds the API view of a job, including its live queue position and ETA."""
+    status = JobStatus(**job)
+    if job["status"] in ("pending", "processing"):
+        status.queue_position = scheduler.queue_position(job["job_id"])
+        eta = scheduler.eta_seconds(job["job_id"], job.get("progress") or 0)
+        status.eta_seconds = round(eta, 1) if eta is not None else None
+    return status
+
 @app.post("/upload", response_model=JobStatus)
 async def upload_presentation(
-    background_tasks: BackgroundTasks,
-    file: UploadFile = File(...)
+    request: Request,
+    file: UploadFile = File(...),
+    voice: Optional[str] = Form(None),
+    profiles: Optional[str] = Form(None),
+    priority: str = Form("normal")
 ):
-    """Upload a PowerPoint presentation and start conversion."""
+    """Upload a PowerPoint presentation and queue it for conversion."""
     
     # Validate file type
     if not file.filename.lower().endswith('.pptx'):
@@ -135,18 +269,53 @@ async def upload_presentation(
             detail="Only PowerPoint (.pptx) files are supported"
         )
     
+    # Validate the requested voice
+    if tts_registry is not None:
+        try:
+            voice = tts_registry.resolve_voice(voice)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    
+    if priority not in PRIORITY_CLASSES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"priority must be one of: {', '.join(PRIORITY_CLASSES)}"
+        )
+    
+    # Validate the requested output profiles (comma-separated)
+    try:
+        profile_list = parse_profiles(profiles)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    content = await file.read()
+    
+    # Identical deck and settings already converting: attach to that job
+    upload_key = upload_coalescing_key(content, voice, profile_list)
+    existing = jobs.get(inflight_uploads.get(upload_key, ""))
+    if existing and existing["status"] in ("pending", "processing"):
+        existing["coalesced_requests"] = (existing.get("coalesced_requests") or 0) + 1
+        attached = existing["attached_clients"]
+        attached[client_id_for(request)] = attached.get(client_id_for(request), 0) + 1
+        return job_status(existing)
+    
+    # Refuse over-quota clients before anything is written to disk
+    try:
+        scheduler.check_quota(client_id_for(request))
+    except QuotaExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    
     # Create job ID and directory
     job_id = str(uuid.uuid4())
-    job_dir = Path(f"uploads/{job_id}")
-    job_dir.mkdir(parents=True, exist_ok=True)
+    job_dir = workspace.create(job_id)
     
     # Save uploaded file
     file_path = job_dir / file.filename
     try:
         with open(file_path, "wb") as buffer:
-            content = await file.read()
             buffer.write(content)
     except Exception as e:
+        workspace.remove(job_id)
         raise HTTPException(status_code=500, detail=f"Failed to save file: {e}")
     
     # Create job record
@@ -154,21 +323,38 @@ async def upload_presentation(
         "job_id": job_id,
         "status": "pending",
         "progress": 0,
-        "message": "File uploaded, starting conversion...",
+        "message": "File uploaded, waiting for a conversion slot...",
         "created_at": datetime.now(),
         "filename": file.filename,
         "file_path": str(file_path),
         "slides_total": None,
         "slides_processed": 0,
-        "video_url": None
+        "video_url": None,
+        "draft_video_url": None,
+        "profiles": profile_list,
+        "renditions": None,
+        "priority": priority,
+        "client_id": client_id_for(request),
+        "attached_clients": {client_id_for(request): 1},  # Uploaders sharing the job, see detach_client
+        "cancel_token": CancelToken(),
+        "upload_key": upload_key,
+        "voice": voice
     }
     
-    jobs[job_id] = job
-    
-    # Start background conversion
-    background_tasks.add_task(process_presentation, job_id)
+    # Queue the conversion; the scheduler starts it when a slot is free
+    try:
+        scheduler.submit(
+            job_id, lambda: process_presentation(job_id),
+            client_id=job["client_id"], priority=priority,
+            slides=count_slides(str(file_path))
+        )
+    except QuotaExceeded as e:
+        workspace.remove(job_id)
+        raise HTTPException(status_code=429, detail=str(e))
     
-    return JobStatus(**job)
+    jobs[job_id] = job
+    inflight_uploads[upload_key] = job_id
+    return job_status(job)
 
 @app.get("/status/{job_id}", response_model=JobStatus)
 async def get_job_status(job_id: str):
@@ -178,12 +364,48 @@ async def get_job_status(job_id: str):
         raise HTTPException(status_code=404, detail="Job not found")
     
     job = jobs[job_id]
-    return JobStatus(**job)
+    return job_status(job)
 
 @app.get("/jobs", response_model=List[JobStatus])
 async def list_jobs():
     """List all conversion jobs."""
-    return [JobStatus(**job) for job in jobs.values()]
+    return [job_status(job) for job in jobs.values()]
+
+@app.post("/jobs/{job_id}/cancel", response_model=JobStatus)
+async def cancel_job(job_id: str, request: Request):
+    """Stop a queued or running conversion (or script regeneration)."""
+    
+    if job_id not in jobs:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    job = jobs[job_id]
+    if job["status"] not in ("pending", "processing", "cancelling"):
+        raise HTTPException(status_code=400, detail=f"Job is {job['status']}, nothing to cancel")
+    if job["status"] == "cancelling":
+        return job_status(job)
+    
+    # A job shared through coalesced uploads keeps running for the other clients
+    if detach_client(job, request):
+        await request_cancellation(job)
+    return job_status(job)
+
+@app.delete("/jobs/{job_id}")
+async def delete_job(job_id: str, request: Request):
+    """Cancel the job if it is still active, then delete it and all its files."""
+    
+    if job_id not in jobs:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    if not detach_client(jobs[job_id], request):
+        return {"message": f"Detached from job {job_id}; other clients still use it"}
+    job = jobs.pop(job_id)
+    job["deleted"] = True
+    if job["status"] in ("pending", "processing", "cancelling"):
+        # The job's own task removes the files once its stages have stopped
+        await request_cancellation(job)
+    else:
+        cleanup_job_artifacts(job, "delete")
+    return {"message": f"Job {job_id} deleted"}
 
 @app.get("/scripts/{job_id}")
 async def get_scripts(job_id: str):
@@ -196,22 +418,27 @@ async def get_scripts(job_id: str):
     if job["status"] not in ["processing", "completed"]:
         raise HTTPException(status_code=400, detail="Scripts not yet available")
     
-    # Find the temp directory
-    file_path = Path(job["file_path"])
-    base_name = file_path.stem
-    temp_dir = file_path.parent / f"{base_name}_temp_files"
+    temp_dir = job_work_dir(job)
+    workspace.touch(job_id)
+    if job["status"] == "completed" and not job.get("regenerating") and not work_dir_ready(job):
+        # Evicted: the scripts are cached, so read them there instead of rebuilding slides
+        temp_dir = workspace.cache_dir(job_id)
     
     scripts = []
     slide_num = 1
+    dedup_plan = job.get("dedup_plan")
     
     while True:
         script_path = temp_dir / f"script_{slide_num}.txt"
-        image_path = temp_dir / f"slide_{slide_num}.png"
         
-        if not script_path.exists():
+        # Merged build-step slides have an image but no script of their own
+        merged = (dedup_plan is not None and slide_num <= (job.get("slides_total") or 0)
+                  and dedup_plan.is_dropped(slide_num - 1))
+        if not script_path.exists() and not merged:
             break
             
-        script_text = load_script_from_file(str(script_path)) or ""
+        script_text = load_script_from_file(str(script_path)) if script_path.exists() else ""
+        script_text = script_text or ""
         
         scripts.append(SlideScript(
             slide_number=slide_num,
@@ -223,11 +450,14 @@ async def get_scripts(job_id: str):
     
     return scripts
 
+def regeneration_is_active(job: Dict) -> bool:
+    """True while a script regeneration of ``job`` is queued or running."""
+    return bool(job.get("regenerating")) and job["status"] in ("pending", "processing")
+
 @app.put("/scripts/{job_id}")
 async def update_scripts(
     job_id: str,
-    script_update: ScriptUpdate,
-    background_tasks: BackgroundTasks
+    script_update: ScriptUpdate
 ):
     """Update scripts and regenerate affected audio/video."""
     
@@ -235,13 +465,18 @@ async def update_scripts(
         raise HTTPException(status_code=404, detail="Job not found")
     
     job = jobs[job_id]
-    if job["status"] not in ["completed"]:
+    if job["status"] not in ["completed"] and not regeneration_is_active(job):
         raise HTTPException(status_code=400, detail="Job must be completed before editing scripts")
     
-    # Find the temp directory
-    file_path = Path(job["file_path"])
-    base_name = file_path.stem
-    temp_dir = file_path.parent / f"{base_name}_temp_files"
+    temp_dir = await ensure_work_dir(job)
+    
+    # The rebuild may have awaited: another edit can have started a regeneration
+    # meanwhile, or the job may be gone, so decide from the state as it is now
+    if job.get("deleted") or jobs.get(job_id) is not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    regeneration_active = regeneration_is_active(job)
+    if job["status"] not in ["completed"] and not regeneration_active:
+        raise HTTPException(status_code=400, detail="Job must be completed before editing scripts")
     
     # Update script files
     updated_scripts = []
@@ -249,42 +484,86 @@ async def update_scripts(
         script_path = temp_dir / f"script_{slide_num}.txt"
         if save_script_to_file(script_text, str(script_path), slide_num):
             updated_scripts.append(slide_num)
+    workspace.promote(job_id)  # Edits survive a scratch eviction before the regeneration runs
+    
+    if updated_scripts and regeneration_active:
+        # One regeneration per job: it picks these slides up before its next render
+        job["pending_script_updates"].update(updated_scripts)
+        job["coalesced_requests"] = (job.get("coalesced_requests") or 0) + 1
+        return {"message": f"Merged slides {updated_scripts} into the running regeneration"}
     
     if updated_scripts:
+        # Queue the regeneration; edits only touch a few slides, so it is a short job
+        job["cancel_token"] = CancelToken()
+        job["pending_script_updates"] = set(updated_scripts)
+        try:
+            scheduler.submit(
+                job_id, lambda: regenerate_audio_and_video(job_id),
+                client_id=job.get("client_id", "anonymous"), priority=job.get("priority", "normal"),
+                slides=len(updated_scripts),
+                # Only the edited slides are synthesized again; every slide is rendered
+                stage_slides={
+                    "tts": len(updated_scripts),
+                    "preview": job.get("slides_total") or len(updated_scripts),
+                    "render": job.get("slides_total") or len(updated_scripts),
+                }
+            )
+        except QuotaExceeded as e:
+            raise HTTPException(status_code=429, detail=str(e))
+        
         # Update job status
         job["status"] = "processing"
+        job["regenerating"] = True
         job["message"] = f"Regenerating audio for {len(updated_scripts)} updated scripts..."
         job["progress"] = 0
         
-        # Start background regeneration
-        background_tasks.add_task(regenerate_audio_and_video, job_id, updated_scripts)
-        
         return {"message": f"Started regeneration for slides: {updated_scripts}"}
     else:
         return {"message": "No scripts were updated"}
 
 @app.get("/download/{job_id}")
-async def download_video(job_id: str):
-    """Download the generated video."""
+async def download_video(job_id: str, variant: str = "final", profile: Optional[str] = None):
+    """
+    Download the generated video, its draft preview with ?variant=draft, or
+    one of the requested renditions with ?profile=720p (or ?profile=audio).
+    """
     
     if job_id not in jobs:
         raise HTTPException(status_code=404, detail="Job not found")
     
     job = jobs[job_id]
-    if job["status"] != "completed":
-        raise HTTPException(status_code=400, detail="Video not yet ready")
-    
-    # Find the video file
     file_path = Path(job["file_path"])
     base_name = file_path.stem
-    video_path = file_path.parent / f"{base_name}_presentation.mp4"
+    
+    if profile:
+        if job["status"] != "completed" or profile not in (job.get("renditions") or {}):
+            raise HTTPException(status_code=400, detail=f"Rendition '{profile}' not available")
+        rendition = Path(rendition_path(str(file_path.parent / f"{base_name}_presentation.mp4"), profile))
+        if not rendition.exists():
+            raise HTTPException(status_code=404, detail="Rendition file not found")
+        media_type = "audio/mp4" if OUTPUT_PROFILES[profile].get("audio_only") else "video/mp4"
+        return FileResponse(path=str(rendition), filename=rendition.name, media_type=media_type)
+    
+    if variant == "draft":
+        if not job.get("draft_video_url"):
+            raise HTTPException(status_code=400, detail="Preview not yet ready")
+        video_name = f"{base_name}_draft.mp4"
+    elif variant == "final":
+        if job["status"] != "completed":
+            raise HTTPException(status_code=400, detail="Video not yet ready")
+        video_name = f"{base_name}_presentation.mp4"
+    else:
+        raise HTTPException(status_code=400, detail="variant must be 'final' or 'draft'")
+    
+    # Find the video file
+    video_path = file_path.parent / video_name
     
     if not video_path.exists():
         raise HTTPException(status_code=404, detail="Video file not found")
     
     return FileResponse(
         path=str(video_path),
-        filename=f"{base_name}_presentation.mp4",
+        filename=video_name,
         media_type="video/mp4"
     )
 
@@ -296,167 +575,456 @@ async def get_slide_image(job_id: str, slide_num: int):
         raise HTTPException(status_code=404, detail="Job not found")
     
     job = jobs[job_id]
-    file_path = Path(job["file_path"])
-    base_name = file_path.stem
-    temp_dir = file_path.parent / f"{base_name}_temp_files"
-    image_path = temp_dir / f"slide_{slide_num}.png"
+    workspace.touch(job_id)
+    image_path = job_work_dir(job) / f"slide_{slide_num}.png"
+    
+    if job["status"] == "completed" and not work_dir_ready(job):
+        # Evicted: rebuild in the background instead of holding the request for LibreOffice
+        rebuild = job.get("workspace_rebuild")
+        if rebuild is None or rebuild.done():
+            job["workspace_rebuild"] = asyncio.create_task(ensure_work_dir(job))
+        raise HTTPException(status_code=503, detail="Slide previews are being rebuilt",
+                            headers={"Retry-After": "5"})
     
     if not image_path.exists():
         raise HTTPException(status_code=404, detail="Slide image not found")
     
     return FileResponse(path=str(image_path), media_type="image/png")
 
+def job_work_dir(job: Dict) -> Path:
+    """The job's scratch directory for slides, scripts, narrations and temp files."""
+    return workspace.scratch_dir(job["job_id"])
+
+def work_dir_ready(job: Dict) -> bool:
+    """False once the collector has evicted the job's scratch directory."""
+    return (job_work_dir(job) / "slide_1.png").exists()
+
+async def ensure_work_dir(job: Dict, cancel_token: Optional[CancelToken] = None) -> Path:
+    """
+    Returns the job's scratch directory, rebuilding it if the collector evicted
+    it: slides are rendered again from the deck and the cached scripts and
+    narrations are copied back. Cancelling ``cancel_token`` kills the rebuild.
+    """
+    job_id = job["job_id"]
+    work_dir = job_work_dir(job)
+    workspace.touch(job_id)
+    if work_dir_ready(job):
+        return work_dir
+    async with job.setdefault("workspace_lock", asyncio.Lock()):
+        if not work_dir_ready(job):
+            with workspace.pin(job_id):
+                print(f"Rebuilding evicted workspace of job {job_id}")
+                try:
+                    await scheduler.run_stage(
+                        "convert", extract_slides_as_images_linux, job["file_path"], str(work_dir), None,
+                        cancel_token, slides=job.get("slides_total") or 1, cancel_token=cancel_token
+                    )
+                except JobCancelled:
+                    # A half-rasterized deck must not pass for a ready workspace
+                    (work_dir / "slide_1.png").unlink(missing_ok=True)
+                    raise
+                await asyncio.get_running_loop().run_in_executor(None, workspace.restore, job_id)
+    return work_dir
+
+async def workspace_gc_loop():
+    """Periodically evicts idle scratch, expired jobs and jobs over the disk budget."""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(WORKSPACE_GC_INTERVAL)
+        active = [job_id for job_id, job in jobs.items() if job["status"] in ("pending", "processing", "cancelling")]
+        reclaimed_before = sum(workspace.metrics["reclaimed_bytes"].values())
+        try:
+            expired = await loop.run_in_executor(None, workspace.collect, list(jobs), active)
+        except Exception as e:
+            print(f"Workspace GC failed: {e}")
+            continue
+        for job_id in expired:
+            job = jobs.pop(job_id, None)
+            if job:
+                release_upload_key(job)
+        reclaimed = sum(workspace.metrics["reclaimed_bytes"].values()) - reclaimed_before
+        if reclaimed or expired:
+            print(f"Workspace GC reclaimed {reclaimed / 1024 / 1024:.1f} MB, expired {len(expired)} jobs")
+
+@asynccontextmanager
+async def job_tts_engine(job: Dict):
+    """
+    Yields the shared TTS engine for the job's voice, pinned while in use.
+    The voice is pinned before it is loaded, and loaded in a worker thread, so
+    another job's load cannot evict it in between and force a reload on the
+    event loop. After a cancellation the pin is kept until the stage threads
+    the job abandoned have finished, since they may still be synthesizing.
+    """
+    if tts_registry is None:
+        yield None
+        return
+    token = job["cancel_token"]
+    token.raise_if_cancelled()
+    acquired = tts_registry.acquire(job.get("voice"))
+    with ExitStack() as pin:
+        engine = await asyncio.get_running_loop().run_in_executor(None, acquired.__enter__)
+        pin.push(acquired.__exit__)
+        try:
+            token.raise_if_cancelled()  # A load can take tens of seconds
+            yield engine
+        finally:
+            pending = [future for future in token.abandoned if not future.done()]
+            if pending:
+                release = pin.pop_all()
+                asyncio.ensure_future(asyncio.wait(pending)).add_done_callback(lambda _: release.close())
+
+def segment_sources(job: Dict, slide_images: List[str], audio_files: List[Optional[str]]):
+    """Applies the job's dedup plan (if any) to the slides that go into the video."""
+    dedup_plan = job.get("dedup_plan")
+    if dedup_plan is None or len(dedup_plan.sources) != len(slide_images):
+        return slide_images, audio_files
+    return dedup_plan.segment_sources(slide_images, audio_files)
+
+def render_final_video(image_files: List[str], audio_files: List[Optional[str]], output_path: str,
+                       profiles: Optional[List[str]] = None, cancel_token: Optional[CancelToken] = None,
+                       work_dir: Optional[str] = None):
+    """Full-quality render (all requested renditions) for the low-priority executor."""
+    lower_thread_priority()
+    return render_final_outputs(image_files, audio_files, output_path, profiles, cancel_token, work_dir)
+
+async def request_cancellation(job: Dict):
+    """
+    Cancels the job's token (killing its subprocesses). A job still waiting in
+    the queue is finished here; a running one stops at its next checkpoint.
+    """
+    if job["status"] != "cancelling":
+        job["status"] = "cancelling"
+        job["message"] = "Cancelling..."
+    # Terminating subprocesses may wait briefly, so keep it off the event loop
+    await asyncio.get_running_loop().run_in_executor(None, job["cancel_token"].cancel)
+    if scheduler.cancel(job["job_id"]):
+        await finish_cancellation(job)
+
+def cleanup_job_artifacts(job: Dict, policy: str):
+    """Removes all of a job's files ("delete") or only its half-written outputs ("keep")."""
+    if policy == "delete":
+        workspace.remove(job["job_id"])
+        job["draft_video_url"] = None
+        return
+    for job_dir in (workspace.persistent_dir(job["job_id"]), job_work_dir(job)):
+        for pattern in PARTIAL_ARTIFACT_PATTERNS:
+            for path in job_dir.rglob(pattern):
+                path.unlink(missing_ok=True)
+    workspace.promote(job["job_id"])
+
+async def finish_cancellation(job: Dict):
+    """Marks a cancelled job and reclaims its files according to CANCELLED_ARTIFACTS."""
+    token = job["cancel_token"]
+    if job.get("regenerating"):
+        # The previous video is untouched until a new one replaces it atomically
+        job["regenerating"] = False
+        job["pending_script_updates"] = set()
+        job["status"] = "completed"
+        job["message"] = "Regeneration cancelled. Edited scripts are saved; the video is the previous version."
+        job["progress"] = 100
+        policy = "keep"
+    else:
+        job["status"] = "cancelled"
+        job["message"] = "Conversion cancelled"
+        policy = CANCELLED_ARTIFACTS
+    if job.get("deleted"):
+        policy = "delete"
+    release_upload_key(job)
+    
+    # Stage threads that could not be interrupted must finish before their files go
+    pending = [future for future in token.abandoned if not future.done()]
+    if pending:
+        await asyncio.wait(pending, timeout=CANCEL_CLEANUP_TIMEOUT)
+    for future in token.abandoned:
+        if future.done() and not future.cancelled():
+            future.exception()  # Retrieved, so asyncio does not log it
+    cleanup_job_artifacts(job, policy)
+    print(f"Job {job['job_id']} cancelled ({policy} artifacts)")
+
+async def render_draft_and_final(job: Dict, image_files: List[str], audio_files: List[Optional[str]]):
+    """
+    Renders a quick draft preview, publishes it, then renders the full-quality
+    video in the background at lower priority. Each file appears atomically.
+    Returns (final video path or None, {profile: path}) for this render only;
+    audio-only profile sets produce renditions but no main video.
+    """
+    job_id = job["job_id"]
+    file_path = Path(job["file_path"])
+    base_name = file_path.stem
+    draft_path = file_path.parent / f"{base_name}_draft.mp4"
+    video_path = file_path.parent / f"{base_name}_presentation.mp4"
+    
+    job["message"] = "Rendering preview..."
+    job["progress"] = 85
+    token = job["cancel_token"]
+    work_dir = str(job_work_dir(job))
+    draft = await scheduler.run_stage(
+        "preview", create_draft_video, image_files, audio_files, str(draft_path), token, work_dir,
+        slides=len(image_files), cancel_token=token
+    )
+    if draft:
+        job["draft_video_url"] = f"/download/{job_id}?variant=draft"
+        job["message"] = "Preview ready. Rendering full-quality video..."
+    else:
+        print(f"Draft preview of job {job_id} failed; rendering the final video without one")
+        job["message"] = "Preview failed. Creating video..."
+    job["progress"] = 90
+    
+    job["renditions"] = {}  # Never report a previous render's outputs as this one's
+    video_file, renditions = await scheduler.run_stage(
+        "render", render_final_video, image_files, audio_files, str(video_path), job.get("profiles"), token,
+        work_dir, slides=len(image_files), executor=final_render_executor, cancel_token=token
+    )
+    job["renditions"] = {p: f"/download/{job_id}?profile={p}" for p in renditions}
+    job["video_url"] = f"/download/{job_id}" if video_file else None
+    return video_file, renditions
+
+def prepare_slides(file_path: str, temp_dir: str, cancel_token: Optional[CancelToken] = None):
+    """Rasterizes the deck, then classifies and deduplicates its slides."""
+    slide_images = extract_slides_as_images_linux(file_path, temp_dir, cancel_token=cancel_token)
+    if not slide_images:
+        return None, None, None
+    check_cancelled(cancel_token)
+    slide_contents = analyze_presentation_content(file_path, temp_dir)
+    dedup_plan = plan_slide_deduplication(file_path, temp_dir, slide_contents)
+    return slide_images, slide_contents, dedup_plan
+
 # Background task functions
 async def process_presentation(job_id: str):
     """Background task to process the presentation."""
     
-    try:
-        job = jobs[job_id]
-        file_path = job["file_path"]
-        
-        # Update status
-        job["status"] = "processing"
-        job["message"] = "Extracting slides..."
-        job["progress"] = 10
-        
-        # Extract slides
-        base_name = Path(file_path).stem
-        temp_dir = Path(file_path).parent / f"{base_name}_temp_files"
-        
-        slide_images = extract_slides_as_images_linux(file_path, str(temp_dir))
-        if not slide_images:
-            job["status"] = "failed"
-            job["message"] = "Failed to extract slides"
-            return
-        
-        job["slides_total"] = len(slide_images)
-        job["message"] = f"Processing {len(slide_images)} slides..."
-        job["progress"] = 20
-        
-        # Generate scripts and audio
-        audio_files = []
-        for i, img_path in enumerate(slide_images):
-            slide_num = i + 1
+    job = jobs.get(job_id)
+    if job is None:
+        return  # Deleted while it was queued
+    token = job["cancel_token"]
+    with workspace.pin(job_id):
+        try:
+            token.raise_if_cancelled()  # Keeps a "cancelling" status from being overwritten
+            file_path = job["file_path"]
             
-            # Update progress
-            progress = 20 + (60 * i // len(slide_images))
-            job["progress"] = progress
-            job["message"] = f"Processing slide {slide_num} of {len(slide_images)}..."
-            job["slides_processed"] = slide_num
+            # Update status
+            job["status"] = "processing"
+            job["message"] = "Extracting slides..."
+            job["progress"] = 10
             
-            script_path = temp_dir / f"script_{slide_num}.txt"
-            audio_path = temp_dir / f"audio_{slide_num}.wav"
+            # Extract slides into the job's scratch workspace
+            temp_dir = job_work_dir(job)
             
-            # Generate script if not exists
-            script = None
-            if script_path.exists():
-                script = load_script_from_file(str(script_path))
+            slide_images, slide_contents, dedup_plan = await scheduler.run_stage(
+                "convert", prepare_slides, file_path, str(temp_dir), token,
+                slides=count_slides(file_path), cancel_token=token
+            )
+            if not slide_images:
+                job["status"] = "failed"
+                job["message"] = "Failed to extract slides"
+                return
             
-            if not script and vision_model:
-                script = generate_script_for_slide(
-                    vision_model, img_path, slide_num, len(slide_images)
-                )
-                if script:
-                    save_script_to_file(script, str(script_path), slide_num)
+            if slide_contents:
+                job["text_slides"] = sum(1 for c in slide_contents if c["route"] == "text")
+                job["image_slides"] = len(slide_contents) - job["text_slides"]
             
-            # Generate audio
-            if script and tts_engine:
-                if should_regenerate_audio(str(script_path), str(audio_path)):
-                    audio_file = synthesize_speech_with_coqui(
-                        tts_engine, script, str(audio_path), slide_num
-                    )
-                    audio_files.append(audio_file)
-                else:
-                    audio_files.append(str(audio_path) if audio_path.exists() else None)
-            else:
-                audio_files.append(None)
-        
-        # Create video
-        job["message"] = "Creating video..."
-        job["progress"] = 90
-        
-        video_path = Path(file_path).parent / f"{base_name}_presentation.mp4"
-        create_video_with_moviepy(slide_images, audio_files, str(video_path))
-        
-        # Complete
-        job["status"] = "completed"
-        job["message"] = "Video creation completed successfully!"
-        job["progress"] = 100
-        job["video_url"] = f"/download/{job_id}"
-        
-    except Exception as e:
-        job = jobs[job_id]
-        job["status"] = "failed"
-        job["message"] = f"Error: {str(e)}"
-        print(f"Error processing job {job_id}: {e}")
+            job["dedup_plan"] = dedup_plan  # Reused when the video is rebuilt after edits
+            if dedup_plan:
+                job["duplicate_slides"] = sum(1 for i, src in enumerate(dedup_plan.sources) if src != i)
+            
+            job["slides_total"] = len(slide_images)
+            job["message"] = f"Processing {len(slide_images)} slides..."
+            job["progress"] = 20
+            
+            # Generate scripts and audio
+            audio_files = []
+            async with job_tts_engine(job) as tts_engine:
+                for i, img_path in enumerate(slide_images):
+                    slide_num = i + 1
+                    token.raise_if_cancelled()
+                    
+                    # Update progress
+                    progress = 20 + (60 * i // len(slide_images))
+                    job["progress"] = progress
+                    job["message"] = f"Processing slide {slide_num} of {len(slide_images)}..."
+                    job["slides_processed"] = slide_num
+                    
+                    script_path = temp_dir / f"script_{slide_num}.txt"
+                    audio_path = temp_dir / f"audio_{slide_num}.wav"
+                    
+                    # Merged animation build steps are narrated by their final slide
+                    if dedup_plan and dedup_plan.is_dropped(i):
+                        audio_files.append(None)
+                        continue
+                    
+                    # Near-identical slides reuse the earlier slide's script and audio
+                    source = dedup_plan.source_of(i) if dedup_plan else i
+                    if source != i and not script_path.exists() and audio_files[source]:
+                        _, audio_file = reuse_duplicate_slide(
+                            str(temp_dir / f"script_{source + 1}.txt"), audio_files[source],
+                            str(script_path), str(audio_path), slide_num, source + 1
+                        )
+                        if audio_file:
+                            audio_files.append(audio_file)
+                            continue
+                    
+                    # Generate script if not exists
+                    script = None
+                    if script_path.exists():
+                        script = load_script_from_file(str(script_path))
+                    
+                    slide_content = slide_contents[i] if slide_contents and i < len(slide_contents) else None
+                    
+                    # Stream the new script into TTS sentence by sentence; the script
+                    # slot is held until the slide's audio is done, a tts slot per sentence
+                    if not script and vision_model and tts_engine and STREAMING_TTS:
+                        loop = asyncio.get_running_loop()
+                        script, audio_file = await scheduler.run_stage(
+                            "script", generate_script_and_audio_streaming,
+                            vision_model, tts_engine, img_path, str(script_path), str(audio_path),
+                            slide_num, len(slide_images), None, slide_content, token,
+                            lambda: scheduler.thread_slot("tts", loop),
+                            cancel_token=token
+                        )
+                        if audio_file:
+                            audio_files.append(audio_file)
+                            continue
+                    
+                    if not script and vision_model:
+                        script = await scheduler.run_stage(
+                            "script", generate_script_for_slide,
+                            vision_model, img_path, slide_num, len(slide_images), None, slide_content, token,
+                            cancel_token=token
+                        )
+                        if script:
+                            save_script_to_file(script, str(script_path), slide_num)
+                    
+                    # Generate audio
+                    if script and tts_engine:
+                        if should_regenerate_audio(str(script_path), str(audio_path)):
+                            audio_file = await scheduler.run_stage(
+                                "tts", synthesize_speech_with_coqui,
+                                tts_engine, script, str(audio_path), slide_num, token,
+                                cancel_token=token
+                            )
+                            audio_files.append(audio_file)
+                        else:
+                            audio_files.append(str(audio_path) if audio_path.exists() else None)
+                    else:
+                        audio_files.append(None)
+            
+            # Create draft preview, then the final video
+            video_file, renditions = await render_draft_and_final(job, *segment_sources(job, slide_images, audio_files))
+            if not video_file and not renditions:
+                job["status"] = "failed"
+                job["message"] = "Failed to render the video"
+                return
+            
+            # Complete
+            job["status"] = "completed"
+            job["message"] = "Video creation completed successfully!"
+            job["progress"] = 100
+            
+        except JobCancelled:
+            await finish_cancellation(job)
+        except Exception as e:
+            job["status"] = "failed"
+            job["message"] = f"Error: {str(e)}"
+            print(f"Error processing job {job_id}: {e}")
+        finally:
+            release_upload_key(job)
+            # Scripts and narrations outlive the scratch directory
+            workspace.promote(job_id)
 
-async def regenerate_audio_and_video(job_id: str, updated_slides: List[int]):
-    """Regenerate audio and video for updated scripts."""
+async def regenerate_audio_and_video(job_id: str):
+    """Regenerate audio and video for the job's pending script updates."""
     
-    try:
-        job = jobs[job_id]
-        file_path = job["file_path"]
-        
-        base_name = Path(file_path).stem
-        temp_dir = Path(file_path).parent / f"{base_name}_temp_files"
-        
-        # Find all slides
-        slide_images = []
-        audio_files = []
-        slide_num = 1
-        
-        while True:
-            image_path = temp_dir / f"slide_{slide_num}.png"
-            if not image_path.exists():
-                break
-            slide_images.append(str(image_path))
-            slide_num += 1
-        
-        total_slides = len(slide_images)
-        
-        # Regenerate audio for updated slides
-        for i in range(total_slides):
-            slide_num = i + 1
+    job = jobs.get(job_id)
+    if job is None:
+        return  # Deleted while it was queued
+    token = job["cancel_token"]
+    with workspace.pin(job_id):
+        try:
+            token.raise_if_cancelled()
+            temp_dir = await ensure_work_dir(job, token)
             
-            # Update progress
-            progress = 10 + (70 * i // total_slides)
-            job["progress"] = progress
-            job["message"] = f"Checking slide {slide_num} of {total_slides}..."
+            # Find all slides
+            slide_images = []
+            slide_num = 1
             
-            script_path = temp_dir / f"script_{slide_num}.txt"
-            audio_path = temp_dir / f"audio_{slide_num}.wav"
+            while True:
+                image_path = temp_dir / f"slide_{slide_num}.png"
+                if not image_path.exists():
+                    break
+                slide_images.append(str(image_path))
+                slide_num += 1
             
-            if slide_num in updated_slides:
-                # Regenerate this slide's audio
-                script = load_script_from_file(str(script_path))
-                if script and tts_engine:
-                    audio_file = synthesize_speech_with_coqui(
-                        tts_engine, script, str(audio_path), slide_num
-                    )
-                    audio_files.append(audio_file)
-                else:
-                    audio_files.append(None)
-            else:
-                # Use existing audio
-                audio_files.append(str(audio_path) if audio_path.exists() else None)
-        
-        # Recreate video
-        job["message"] = "Recreating video with updated audio..."
-        job["progress"] = 90
-        
-        video_path = Path(file_path).parent / f"{base_name}_presentation.mp4"
-        create_video_with_moviepy(slide_images, audio_files, str(video_path))
-        
-        # Complete
-        job["status"] = "completed"
-        job["message"] = "Video regenerated successfully!"
-        job["progress"] = 100
-        
-    except Exception as e:
-        job = jobs[job_id]
-        job["status"] = "failed"
-        job["message"] = f"Error during regeneration: {str(e)}"
-        print(f"Error regenerating job {job_id}: {e}")
+            total_slides = len(slide_images)
+            audio_files = [
+                str(temp_dir / f"audio_{i + 1}.wav") if (temp_dir / f"audio_{i + 1}.wav").exists() else None
+                for i in range(total_slides)
+            ]
+            
+            # Edits that arrive while this runs are merged into the next round
+            # instead of starting a second regeneration, so the last render always
+            # reflects the newest scripts
+            video_file, renditions = None, {}
+            while job["pending_script_updates"]:
+                updated_slides = job["pending_script_updates"]
+                job["pending_script_updates"] = set()
+                
+                # Regenerate audio for updated slides
+                async with job_tts_engine(job) as tts_engine:
+                    for i in range(total_slides):
+                        slide_num = i + 1
+                        token.raise_if_cancelled()
+                        
+                        # Update progress
+                        progress = 10 + (70 * i // total_slides)
+                        job["progress"] = progress
+                        job["message"] = f"Checking slide {slide_num} of {total_slides}..."
+                        
+                        if slide_num not in updated_slides:
+                            continue
+                        
+                        script_path = temp_dir / f"script_{slide_num}.txt"
+                        audio_path = temp_dir / f"audio_{slide_num}.wav"
+                        
+                        # Regenerate this slide's audio
+                        script = load_script_from_file(str(script_path))
+                        if script and tts_engine:
+                            audio_files[i] = await scheduler.run_stage(
+                                "tts", synthesize_speech_with_coqui,
+                                tts_engine, script, str(audio_path), slide_num, token,
+                                cancel_token=token
+                            )
+                        else:
+                            audio_files[i] = None
+                
+                if job["pending_script_updates"]:
+                    continue  # Newer edits arrived during synthesis; render once they are in
+                
+                # Recreate draft preview, then the final video
+                video_file, renditions = await render_draft_and_final(
+                    job, *segment_sources(job, slide_images, audio_files)
+                )
+            
+            job["regenerating"] = False
+            if not video_file and not renditions:
+                job["status"] = "failed"
+                job["message"] = "Failed to render the video"
+                return
+            
+            # Complete
+            job["status"] = "completed"
+            job["message"] = "Video regenerated successfully!"
+            job["progress"] = 100
+            
+        except JobCancelled:
+            await finish_cancellation(job)
+        except Exception as e:
+            job["regenerating"] = False
+            job["pending_script_updates"] = set()
+            job["status"] = "failed"
+            job["message"] = f"Error during regeneration: {str(e)}"
+            print(f"Error regenerating job {job_id}: {e}")
+        finally:
+            workspace.promote(job_id)
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,294 @@
+"""
+Job scheduler for the conversion backend.
+
+Uploads no longer start converting immediately. Each job is queued and
+admitted by the scheduler, which provides:
+
+- a bound on how many jobs run at once, and per-stage concurrency limits
+  (LibreOffice conversion, Gemini, TTS, preview and final renders)
+- priority classes ("high", "normal", "low") that are served strictly in order
+- shortest-job-first within a class, using the deck's slide count as a hint,
+  with aging so that large decks are not starved by a stream of small ones
+- per-client quotas on running and queued jobs
+- queue positions and ETAs based on measured per-slide stage throughput
+- cancellation: queued jobs are dropped, and running stages stop waiting for
+  their worker thread within CANCEL_POLL_SECONDS
+"""
+
+import asyncio
+import itertools
+import time
+from contextlib import AsyncExitStack, asynccontextmanager, contextmanager
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from cancellation import CancelToken, JobCancelled
+
+PRIORITY_CLASSES = {"high": 0, "normal": 1, "low": 2}
+
+# Default per-stage concurrency across all jobs
+DEFAULT_STAGE_LIMITS = {
+    "convert": 2,   # LibreOffice PDF export + rasterization
+    "script": 4,    # Gemini requests
+    "tts": 1,       # Shared TTS engines
+    "preview": 2,   # Draft renders
+    "render": 1,    # Full-quality renders
+}
+
+# Seconds per slide assumed for each stage until real measurements exist
+DEFAULT_SECONDS_PER_SLIDE = {
+    "convert": 1.0,
+    "script": 4.0,
+    "tts": 3.0,
+    "preview": 0.3,
+    "render": 1.5,
+}
+
+# Waiting this many seconds counts as one slide less when ordering a class
+AGING_SECONDS_PER_SLIDE = 5.0
+
+# Weight of the newest sample in the per-stage moving average
+THROUGHPUT_SMOOTHING = 0.2
+
+# How often a running stage checks whether its job was cancelled
+CANCEL_POLL_SECONDS = 0.25
+
+
+class QuotaExceeded(Exception):
+    """Raised when a client already has too many jobs queued."""
+
+
+class StageThroughput:
+    """Exponential moving average of seconds per slide for each stage."""
+
+    def __init__(self):
+        self.seconds_per_slide = dict(DEFAULT_SECONDS_PER_SLIDE)
+        self.samples = {stage: 0 for stage in DEFAULT_SECONDS_PER_SLIDE}
+
+    def record(self, stage: str, seconds: float, slides: int = 1):
+        if slides <= 0:
+            return
+        sample = seconds / slides
+        if not self.samples.get(stage):
+            self.seconds_per_slide[stage] = sample
+        else:
+            previous = self.seconds_per_slide[stage]
+            self.seconds_per_slide[stage] = previous + THROUGHPUT_SMOOTHING * (sample - previous)
+        self.samples[stage] = self.samples.get(stage, 0) + 1
+
+    def estimate_job_seconds(self, slides: int, stage_slides: Optional[Dict[str, int]] = None) -> float:
+        """
+        Estimated wall time of a full conversion of ``slides`` slides, or of
+        only the stages in ``stage_slides`` ({stage: slides}) when given.
+        """
+        if stage_slides is None:
+            return max(slides, 1) * sum(self.seconds_per_slide.values())
+        return sum(self.seconds_per_slide[stage] * count for stage, count in stage_slides.items())
+
+
+class ScheduledTask:
+    """A queued or running unit of work for one job."""
+
+    def __init__(self, job_id: str, run: Callable[[], Awaitable], client_id: str,
+                 priority: str, slides: int, seq: int, stage_slides: Optional[Dict[str, int]] = None):
+        self.job_id = job_id
+        self.run = run
+        self.client_id = client_id
+        self.priority = priority
+        self.slides = slides
+        self.stage_slides = stage_slides  # Stages the task runs, when not the whole pipeline
+        self.seq = seq
+        self.enqueued_at = time.monotonic()
+        self.started_at: Optional[float] = None
+
+    def sort_key(self, now: float):
+        aged_slides = self.slides - (now - self.enqueued_at) / AGING_SECONDS_PER_SLIDE
+        return (PRIORITY_CLASSES[self.priority], aged_slides, self.seq)
+
+
+class JobScheduler:
+    """Admits queued jobs under global, per-stage and per-client limits."""
+
+    def __init__(self, max_running_jobs: int = 2, stage_limits: Optional[Dict[str, int]] = None,
+                 max_running_per_client: int = 1, max_queued_per_client: int = 10):
+        self.max_running_jobs = max_running_jobs
+        self.max_running_per_client = max_running_per_client
+        self.max_queued_per_client = max_queued_per_client
+        self.stage_limits = dict(DEFAULT_STAGE_LIMITS, **(stage_limits or {}))
+        self._stage_semaphores = {
+            stage: asyncio.Semaphore(limit) for stage, limit in self.stage_limits.items()
+        }
+        self.throughput = StageThroughput()
+        self._queue: List[ScheduledTask] = []
+        self._running: Dict[int, ScheduledTask] = {}
+        self._seq = itertools.count()
+
+    # --- admission ---
+
+    def check_quota(self, client_id: str):
+        """Raises QuotaExceeded when the client already has too many jobs waiting."""
+        queued = sum(1 for task in self._queue if task.client_id == client_id)
+        if queued >= self.max_queued_per_client:
+            raise QuotaExceeded(f"Client already has {queued} jobs waiting; try again later")
+
+    def submit(self, job_id: str, run: Callable[[], Awaitable], client_id: str = "anonymous",
+               priority: str = "normal", slides: Optional[int] = None,
+               stage_slides: Optional[Dict[str, int]] = None) -> ScheduledTask:
+        """
+        Queues ``run`` (a coroutine function) for ``job_id``. ``stage_slides``
+        limits the ETA to the stages the task actually runs. Raises ValueError
+        for an unknown priority and QuotaExceeded when the client has too many
+        jobs waiting.
+        """
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError(f"Unknown priority '{priority}'. Choose from: {', '.join(PRIORITY_CLASSES)}")
+        self.check_quota(client_id)
+
+        task = ScheduledTask(job_id, run, client_id, priority, slides or 1, next(self._seq), stage_slides)
+        self._queue.append(task)
+        self._dispatch()
+        return task
+
+    def _running_for(self, client_id: str) -> int:
+        return sum(1 for task in self._running.values() if task.client_id == client_id)
+
+    def _next_admissible(self) -> Optional[ScheduledTask]:
+        now = time.monotonic()
+        for task in sorted(self._queue, key=lambda t: t.sort_key(now)):
+            if self._running_for(task.client_id) < self.max_running_per_client:
+                return task
+        return None
+
+    def _dispatch(self):
+        """Starts queued tasks while there is capacity."""
+        while len(self._running) < self.max_running_jobs:
+            task = self._next_admissible()
+            if task is None:
+                return
+            self._queue.remove(task)
+            self._running[task.seq] = task
+            task.started_at = time.monotonic()
+            asyncio.get_running_loop().create_task(self._run(task))
+
+    async def _run(self, task: ScheduledTask):
+        try:
+            await task.run()
+        except JobCancelled:
+            print(f"Scheduled task for job {task.job_id} was cancelled")
+        except Exception as e:
+            print(f"Scheduled task for job {task.job_id} failed: {e}")
+        finally:
+            self._running.pop(task.seq, None)
+            self._dispatch()
+
+    def cancel(self, job_id: str) -> bool:
+        """Drops the queued tasks of ``job_id``. Returns True if any were queued."""
+        queued = [task for task in self._queue if task.job_id == job_id]
+        for task in queued:
+            self._queue.remove(task)
+        return bool(queued)
+
+    # --- stages ---
+
+    @asynccontextmanager
+    async def stage(self, name: str, slides: int = 1):
+        """Holds one of the stage's slots and records its throughput."""
+        async with self._stage_semaphores[name]:
+            start = time.monotonic()
+            try:
+                yield
+            finally:
+                self.throughput.record(name, time.monotonic() - start, slides)
+
+    @contextmanager
+    def thread_slot(self, name: str, loop: asyncio.AbstractEventLoop):
+        """
+        Holds one of the stage's slots from a worker thread, blocking until
+        one is free. For work inside another stage that is briefly subject to
+        this stage's limit too (throughput is not recorded).
+        """
+        semaphore = self._stage_semaphores[name]
+        asyncio.run_coroutine_threadsafe(semaphore.acquire(), loop).result()
+        try:
+            yield
+        finally:
+            loop.call_soon_threadsafe(semaphore.release)
+
+    async def run_stage(self, name: str, func, *args, slides: int = 1, executor=None,
+                        cancel_token: Optional[CancelToken] = None):
+        """
+        Runs a blocking stage function in a worker thread under the stage's
+        limit. If ``cancel_token`` is cancelled, JobCancelled is raised within
+        CANCEL_POLL_SECONDS; a thread that cannot be interrupted keeps running
+        and is recorded in ``cancel_token.abandoned`` so cleanup can wait for it.
+        Its stage slots stay taken until the thread actually finishes.
+        """
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+        async with AsyncExitStack() as slots:
+            await slots.enter_async_context(self.stage(name, slides))
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(executor, func, *args)
+            if cancel_token is None:
+                return await future
+            while True:
+                done, _ = await asyncio.wait({future}, timeout=CANCEL_POLL_SECONDS)
+                if done:
+                    return future.result()
+                if cancel_token.cancelled:
+                    cancel_token.abandoned.append(future)
+                    held = slots.pop_all()
+                    future.add_done_callback(lambda _: loop.create_task(held.aclose()))
+                    raise JobCancelled()
+
+    # --- introspection ---
+
+    def queue_position(self, job_id: str) -> Optional[int]:
+        """1-based position among queued tasks, or None if not queued."""
+        now = time.monotonic()
+        for position, task in enumerate(sorted(self._queue, key=lambda t: t.sort_key(now)), start=1):
+            if task.job_id == job_id:
+                return position
+        return None
+
+    def is_running(self, job_id: str) -> bool:
+        return any(task.job_id == job_id for task in self._running.values())
+
+    def eta_seconds(self, job_id: str, progress: int = 0) -> Optional[float]:
+        """
+        Estimated seconds until ``job_id`` finishes, from measured stage
+        throughput. Queued jobs wait for the work ahead of them spread over
+        the running slots.
+        """
+        def estimate(task):
+            return self.throughput.estimate_job_seconds(task.slides, task.stage_slides)
+
+        for task in self._running.values():
+            if task.job_id == job_id:
+                return estimate(task) * (1 - min(progress, 99) / 100)
+
+        now = time.monotonic()
+        ahead = sum(
+            estimate(task) * (1 - min(self._progress_hint(task), 99) / 100)
+            for task in self._running.values()
+        )
+        for task in sorted(self._queue, key=lambda t: t.sort_key(now)):
+            if task.job_id == job_id:
+                return ahead / max(self.max_running_jobs, 1) + estimate(task)
+            ahead += estimate(task)
+        return None
+
+    def _progress_hint(self, task: ScheduledTask) -> int:
+        """Elapsed share of a running task's estimate, as a percentage."""
+        if task.started_at is None:
+            return 0
+        expected = self.throughput.estimate_job_seconds(task.slides, task.stage_slides)
+        return int(100 * (time.monotonic() - task.started_at) / expected) if expected else 0
+
+    def stats(self) -> Dict:
+        return {
+            "running": len(self._running),
+            "queued": len(self._queue),
+            "max_running_jobs": self.max_running_jobs,
+            "stage_limits": self.stage_limits,
+            "seconds_per_slide": {k: round(v, 2) for k, v in self.throughput.seconds_per_slide.items()},
+        }
@@ -0,0 +1,283 @@
+"""
+Per-job workspaces for the conversion backend.
+
+Each job gets two directories:
+
+- a scratch directory on a fast filesystem (tmpfs such as /dev/shm by
+  default) for hot intermediates: the PDF export, 300-DPI slide images,
+  scripts and narrations while they are being produced, temporary encoder
+  files
+- a persistent directory under ``uploads/`` for the uploaded deck, the
+  rendered videos, and a ``cache`` of the artifacts that are expensive to
+  recreate (scripts and narrations), promoted there when a job finishes
+
+A background garbage collector evicts scratch directories of idle jobs
+(they can be rebuilt from the deck and the cache), deletes jobs whose TTL
+has expired, and evicts the least recently used jobs while the total disk
+usage exceeds the budget. Jobs that are in use are pinned and never touched.
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+# Artifacts promoted to persistent storage; everything else in scratch is rebuildable
+CACHEABLE_PATTERNS = ("script_*.txt", "audio_*.wav")
+
+DEFAULT_SCRATCH_TTL = 30 * 60            # Idle seconds before a finished job's scratch is evicted
+DEFAULT_JOB_TTL = 7 * 24 * 60 * 60       # Idle seconds before a finished job is deleted
+DEFAULT_DISK_BUDGET_MB = 10 * 1024       # Scratch plus persistent storage
+DEFAULT_GC_INTERVAL = 60                 # Seconds between collections
+
+
+def default_scratch_root(required_bytes: int = 0) -> str:
+    """
+    /dev/shm when it is usable (tmpfs on Linux) and has ``required_bytes``
+    free, else the system temp directory. Containers often mount a 64 MB
+    /dev/shm, which a single deck's 300-DPI slides would fill.
+    """
+    shm = "/dev/shm"
+    if os.path.isdir(shm) and os.access(shm, os.W_OK):
+        try:
+            free = shutil.disk_usage(shm).free
+        except OSError:
+            free = 0
+        if free >= required_bytes:
+            return os.path.join(shm, "powerpoint-to-video")
+    return os.path.join(tempfile.gettempdir(), "powerpoint-to-video")
+
+
+def directory_size(path: Path) -> int:
+    """Total size in bytes of the files under ``path`` (0 if it does not exist)."""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def last_modified(path: Path) -> float:
+    """Newest mtime under ``path``, used as the last activity of orphaned directories."""
+    newest = 0.0
+    for root, _, files in os.walk(path):
+        for name in [root] + [os.path.join(root, f) for f in files]:
+            try:
+                newest = max(newest, os.lstat(name).st_mtime)
+            except OSError:
+                pass
+    return newest
+
+
+class WorkspaceManager:
+    """Creates, promotes and garbage-collects per-job scratch and persistent directories."""
+
+    def __init__(self, persistent_root: str = "uploads", scratch_root: Optional[str] = None,
+                 scratch_ttl: float = DEFAULT_SCRATCH_TTL, job_ttl: float = DEFAULT_JOB_TTL,
+                 disk_budget_mb: float = DEFAULT_DISK_BUDGET_MB):
+        self.persistent_root = Path(persistent_root)
+        self.disk_budget_bytes = int(disk_budget_mb * 1024 * 1024)
+        # tmpfs only when it can hold the whole budget; the collector does not watch its free space
+        self.scratch_root = Path(scratch_root or default_scratch_root(self.disk_budget_bytes))
+        self.scratch_ttl = scratch_ttl
+        self.job_ttl = job_ttl
+        self.persistent_root.mkdir(parents=True, exist_ok=True)
+        self.scratch_root.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._pins: Dict[str, int] = {}
+        self._last_used: Dict[str, float] = {}
+        self.metrics = {
+            "gc_runs": 0,
+            "reclaimed_bytes": {"scratch_ttl": 0, "job_ttl": 0, "budget": 0, "orphan": 0},
+            "evicted_scratch": 0,
+            "expired_jobs": 0,
+            "last_gc_at": None,
+            "last_gc_seconds": None,
+        }
+
+    # --- layout ---
+
+    def persistent_dir(self, job_id: str) -> Path:
+        return self.persistent_root / job_id
+
+    def scratch_dir(self, job_id: str) -> Path:
+        return self.scratch_root / job_id
+
+    def cache_dir(self, job_id: str) -> Path:
+        return self.persistent_dir(job_id) / "cache"
+
+    def create(self, job_id: str) -> Path:
+        """Creates both directories of a new job and returns the persistent one."""
+        self.scratch_dir(job_id).mkdir(parents=True, exist_ok=True)
+        self.persistent_dir(job_id).mkdir(parents=True, exist_ok=True)
+        self.touch(job_id)
+        return self.persistent_dir(job_id)
+
+    # --- usage tracking ---
+
+    def touch(self, job_id: str):
+        with self._lock:
+            self._last_used[job_id] = time.time()
+
+    @contextmanager
+    def pin(self, job_id: str):
+        """Keeps the collector away from ``job_id`` while its files are in use."""
+        with self._lock:
+            self._pins[job_id] = self._pins.get(job_id, 0) + 1
+            self._last_used[job_id] = time.time()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._pins[job_id] -= 1
+                if not self._pins[job_id]:
+                    del self._pins[job_id]
+                self._last_used[job_id] = time.time()
+
+    # --- promotion ---
+
+    def promote(self, job_id: str) -> int:
+        """Copies the job's cacheable artifacts from scratch to persistent storage."""
+        scratch, cache = self.scratch_dir(job_id), self.cache_dir(job_id)
+        if not scratch.is_dir():
+            return 0
+        cache.mkdir(parents=True, exist_ok=True)
+        promoted = 0
+        for pattern in CACHEABLE_PATTERNS:
+            for path in scratch.glob(pattern):
+                target = cache / path.name
+                if target.exists() and target.stat().st_mtime >= path.stat().st_mtime:
+                    continue
+                shutil.copy2(path, target)  # Keeps mtimes, so audio stays newer than its script
+                promoted += 1
+        return promoted
+
+    def restore(self, job_id: str) -> int:
+        """Copies cached artifacts back into a rebuilt scratch directory."""
+        scratch, cache = self.scratch_dir(job_id), self.cache_dir(job_id)
+        scratch.mkdir(parents=True, exist_ok=True)
+        restored = 0
+        if cache.is_dir():
+            for path in cache.iterdir():
+                shutil.copy2(path, scratch / path.name)
+                restored += 1
+        self.touch(job_id)
+        return restored
+
+    # --- removal ---
+
+    def remove(self, job_id: str) -> int:
+        """Deletes everything belonging to a job. Returns the bytes reclaimed."""
+        with self._lock:
+            self._last_used.pop(job_id, None)
+            return self._remove_paths(self.scratch_dir(job_id), self.persistent_dir(job_id))
+
+    def _remove_paths(self, *paths: Path) -> int:
+        reclaimed = 0
+        for path in paths:
+            if path.exists():
+                reclaimed += directory_size(path)
+                shutil.rmtree(path, ignore_errors=True)
+        return reclaimed
+
+    # --- garbage collection ---
+
+    def _idle_since(self, job_id: str) -> float:
+        last_used = self._last_used.get(job_id)
+        if last_used is not None:
+            return last_used
+        return max(last_modified(self.scratch_dir(job_id)), last_modified(self.persistent_dir(job_id)))
+
+    def usage(self) -> Dict[str, int]:
+        return {
+            "scratch_bytes": directory_size(self.scratch_root),
+            "persistent_bytes": directory_size(self.persistent_root),
+        }
+
+    def collect(self, known_jobs: Iterable[str], active_jobs: Iterable[str]) -> List[str]:
+        """
+        Runs one collection. ``known_jobs`` are the job ids the API still
+        serves and ``active_jobs`` those queued or running. Returns the ids of
+        jobs whose files were deleted, so the caller can forget them.
+        """
+        started = time.time()
+        known, active = set(known_jobs), set(active_jobs)
+        reclaimed = self.metrics["reclaimed_bytes"]
+        expired = []
+
+        def collectable(job_id):
+            return job_id not in active and job_id not in self._pins
+
+        # Scratch without a job is useless; persistent orphans follow the job TTL
+        for path in list(self.scratch_root.iterdir()):
+            if path.name not in known:
+                with self._lock:
+                    if collectable(path.name):
+                        reclaimed["orphan"] += self._remove_paths(path)
+        for path in list(self.persistent_root.iterdir()):
+            if path.is_dir() and path.name not in known and started - last_modified(path) > self.job_ttl:
+                with self._lock:
+                    if collectable(path.name):
+                        reclaimed["orphan"] += self._remove_paths(path)
+
+        for job_id in known:
+            with self._lock:
+                if not collectable(job_id):
+                    continue
+                idle = started - self._idle_since(job_id)
+                if idle > self.job_ttl:
+                    reclaimed["job_ttl"] += self._remove_paths(self.scratch_dir(job_id), self.persistent_dir(job_id))
+                    self._last_used.pop(job_id, None)
+                    self.metrics["expired_jobs"] += 1
+                    expired.append(job_id)
+                elif idle > self.scratch_ttl and self.scratch_dir(job_id).exists():
+                    reclaimed["scratch_ttl"] += self._remove_paths(self.scratch_dir(job_id))
+                    self.metrics["evicted_scratch"] += 1
+
+        # Over budget: evict scratch, then whole jobs, least recently used first
+        usage = self.usage()
+        total = usage["scratch_bytes"] + usage["persistent_bytes"]
+        if total > self.disk_budget_bytes:
+            candidates = sorted((j for j in known if j not in expired), key=self._idle_since)
+            for evict_job in (False, True):
+                for job_id in candidates:
+                    if total <= self.disk_budget_bytes:
+                        break
+                    with self._lock:
+                        if not collectable(job_id) or job_id in expired:
+                            continue
+                        if evict_job:
+                            freed = self._remove_paths(self.scratch_dir(job_id), self.persistent_dir(job_id))
+                            self._last_used.pop(job_id, None)
+                            self.metrics["expired_jobs"] += 1
+                            expired.append(job_id)
+                        else:
+                            freed = self._remove_paths(self.scratch_dir(job_id))
+                            if freed:
+                                self.metrics["evicted_scratch"] += 1
+                    reclaimed["budget"] += freed
+                    total -= freed
+
+        self.metrics["gc_runs"] += 1
+        self.metrics["last_gc_at"] = started
+        self.metrics["last_gc_seconds"] = round(time.time() - started, 3)
+        return expired
+
+    def stats(self) -> Dict:
+        usage = self.usage()
+        return {
+            "scratch_root": str(self.scratch_root),
+            "persistent_root": str(self.persistent_root),
+            **usage,
+            "disk_budget_bytes": self.disk_budget_bytes,
+            **self.metrics,
+            "reclaimed_bytes_total": sum(self.metrics["reclaimed_bytes"].values()),
+        }
@@ -0,0 +1,393 @@
+"""
+Batch mode for auto_presenter: converts many decks in one process.
+
+    python batch_presenter.py <directory_or_manifest> [--profiles LIST]
+
+All decks share one Gemini model and rate limiter, one loaded TTS engine and
+a fixed set of worker pools, one per pipeline stage:
+
+- convert: LibreOffice PDF export + rasterization (one profile per worker)
+- script : Gemini script generation, throttled by the shared rate limiter
+- tts    : speech synthesis on the shared engine (a single worker)
+- encode : MoviePy video assembly, or one ffmpeg pass for all output profiles
+
+Each deck moves through the stages independently, so while one deck is
+being encoded another can be synthesizing and a third waiting on Gemini.
+A throughput report is printed once every deck has finished.
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from auto_presenter import (
+    OUTPUT_PROFILES,
+    analyze_presentation_content,
+    extract_slides_as_images_linux,
+    get_or_generate_script,
+    get_or_synthesize_audio,
+    init_pipeline,
+    parse_profiles,
+    plan_slide_deduplication,
+    render_final_outputs,
+    resolve_pptx_path,
+    reuse_duplicate_slide,
+)
+
+STAGES = ("convert", "script", "tts", "encode")
+
+
+def discover_decks(source):
+    """
+    Returns the .pptx paths to convert. ``source`` is either a directory
+    (every .pptx inside it) or a manifest file with one path per line;
+    blank lines and lines starting with '#' are ignored and relative paths
+    are resolved against the manifest's directory.
+    """
+    if os.path.isdir(source):
+        names = sorted(
+            name for name in os.listdir(source)
+            if name.lower().endswith(".pptx") and not name.startswith("~$")
+        )
+        return [os.path.abspath(os.path.join(source, name)) for name in names]
+
+    if os.path.isfile(source):
+        base_dir = os.path.dirname(os.path.abspath(source))
+        decks = []
+        with open(source, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                decks.append(os.path.abspath(os.path.join(base_dir, line)))
+        return decks
+
+    print(f"Error: Batch source not found: {source}")
+    return None
+
+
+class DeckResult:
+    """Outcome and timings of one deck in a batch."""
+
+    def __init__(self, pptx_path):
+        self.pptx_path = pptx_path
+        self.name = os.path.splitext(os.path.basename(pptx_path))[0]
+        self.base_dir = os.path.dirname(pptx_path)
+        self.temp_dir = os.path.join(self.base_dir, f"{self.name}_temp_files")
+        self.video_path = os.path.join(self.base_dir, f"{self.name}_presentation.mp4")
+        self.outputs = []  # Files written by the encode stage (main video and/or renditions)
+        self.slide_images = []
+        self.slide_contents = None
+        self.dedup_plan = None
+        self.duplicates = {}  # source slide index -> indexes of slides reusing it
+        self.audio_files = []
+        self.succeeded = False
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+        self.done = threading.Event()
+        self._remaining = 0
+        self._lock = threading.Lock()
+
+    @property
+    def seconds(self):
+        if self.started_at is None or self.finished_at is None:
+            return 0.0
+        return self.finished_at - self.started_at
+
+
+class BatchScheduler:
+    """Runs decks through shared per-stage worker pools."""
+
+    def __init__(self, vision_model, tts_engine, rate_limiter,
+                 convert_workers=2, script_workers=4, encode_workers=2, profiles=None):
+        self.vision_model = vision_model
+        self.profiles = profiles
+        self.tts_engine = tts_engine
+        self.rate_limiter = rate_limiter
+        self.workers = {
+            "convert": max(1, convert_workers),
+            "script": max(1, script_workers),
+            "tts": 1,  # One shared engine; inference is serialized anyway
+            "encode": max(1, encode_workers),
+        }
+        self.pools = {
+            stage: ThreadPoolExecutor(max_workers=count, thread_name_prefix=f"batch-{stage}")
+            for stage, count in self.workers.items()
+        }
+        self.busy_seconds = {stage: 0.0 for stage in STAGES}
+        self.items = {stage: 0 for stage in STAGES}
+        self._stats_lock = threading.Lock()
+        self._local = threading.local()
+        self._profile_dirs = []
+
+    # --- stage plumbing ---
+
+    def _timed(self, stage, fn, *args):
+        """Runs ``fn`` and records its duration against ``stage``; never raises."""
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        except Exception as e:
+            print(f"  - Error in {stage} stage: {e}")
+            return None
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._stats_lock:
+                self.busy_seconds[stage] += elapsed
+                self.items[stage] += 1
+
+    def _submit(self, deck, stage, callback, fn, *args):
+        """Runs ``fn`` on the stage's pool, then hands its result to ``callback``."""
+        def on_done(future):
+            try:
+                callback(future.result())
+            except Exception as e:
+                self._finish(deck, error=f"{stage} stage: {e}")
+
+        self.pools[stage].submit(self._timed, stage, fn, *args).add_done_callback(on_done)
+
+    def _libreoffice_profile(self):
+        """Returns this convert worker's private LibreOffice profile directory."""
+        if not hasattr(self._local, "profile_dir"):
+            self._local.profile_dir = tempfile.mkdtemp(prefix="lo_profile_")
+            with self._stats_lock:
+                self._profile_dirs.append(self._local.profile_dir)
+        return self._local.profile_dir
+
+    # --- deck pipeline ---
+
+    def submit_deck(self, pptx_path):
+        """Queues a deck for conversion and returns its DeckResult."""
+        deck = DeckResult(pptx_path)
+        deck.started_at = time.perf_counter()
+        self._submit(deck, "convert", lambda images: self._on_converted(deck, images), self._convert, deck)
+        return deck
+
+    def _convert(self, deck):
+        slide_images = extract_slides_as_images_linux(deck.pptx_path, deck.temp_dir, self._libreoffice_profile())
+        if slide_images:
+            deck.slide_contents = analyze_presentation_content(deck.pptx_path, deck.temp_dir, deck.name)
+            deck.dedup_plan = plan_slide_deduplication(deck.pptx_path, deck.temp_dir, deck.slide_contents)
+        return slide_images
+
+    def _on_converted(self, deck, slide_images):
+        if not slide_images:
+            self._finish(deck, error="Failed to extract slides")
+            return
+        print(f"\n[batch] {deck.name}: {len(slide_images)} slides extracted")
+        deck.slide_images = slide_images
+        deck.audio_files = [None] * len(slide_images)
+        deck._remaining = len(slide_images)
+        plan = deck.dedup_plan
+        to_generate = []
+        dropped = []
+        for i in range(len(slide_images)):
+            script_path = os.path.join(deck.temp_dir, f"script_{i + 1}.txt")
+            if plan and plan.is_dropped(i):
+                # Merged animation build step: narrated by its final slide
+                dropped.append(i)
+            elif plan and plan.source_of(i) != i and not os.path.exists(script_path):
+                # Near-identical slide: waits for its source slide's audio
+                deck.duplicates.setdefault(plan.source_of(i), []).append(i)
+            else:
+                to_generate.append(i)
+        # Duplicates are registered before any work starts so none can be missed
+        for i in dropped:
+            self._on_audio(deck, i, None)
+        for i in to_generate:
+            self._submit_script(deck, i)
+
+    def _submit_script(self, deck, index):
+        slide_num = index + 1
+        script_path = os.path.join(deck.temp_dir, f"script_{slide_num}.txt")
+        self._submit(
+            deck, "script",
+            lambda script: self._on_script(deck, index, script, script_path),
+            get_or_generate_script,
+            self.vision_model, deck.slide_images[index], script_path, slide_num, len(deck.slide_images),
+            self.rate_limiter,
+            deck.slide_contents[index] if deck.slide_contents and index < len(deck.slide_contents) else None
+        )
+
+    def _on_script(self, deck, index, script, script_path):
+        slide_num = index + 1
+        audio_path = os.path.join(deck.temp_dir, f"audio_{slide_num}.wav")
+        self._submit(
+            deck, "tts",
+            lambda audio: self._on_audio(deck, index, audio),
+            get_or_synthesize_audio,
+            self.tts_engine, script, script_path, audio_path, slide_num
+        )
+
+    def _on_duplicate(self, deck, index, source, source_audio):
+        """Copies the source slide's script and audio, or falls back to generating."""
+        if source_audio:
+            _, audio_file = reuse_duplicate_slide(
+                os.path.join(deck.temp_dir, f"script_{source + 1}.txt"), source_audio,
+                os.path.join(deck.temp_dir, f"script_{index + 1}.txt"),
+                os.path.join(deck.temp_dir, f"audio_{index + 1}.wav"),
+                index + 1, source + 1
+            )
+            if audio_file:
+                self._on_audio(deck, index, audio_file)
+                return
+        self._submit_script(deck, index)
+
+    def _on_audio(self, deck, index, audio_file):
+        deck.audio_files[index] = audio_file
+        for duplicate in deck.duplicates.pop(index, []):
+            self._on_duplicate(deck, duplicate, index, audio_file)
+        with deck._lock:
+            deck._remaining -= 1
+            ready = deck._remaining == 0
+        if not ready:
+            return
+        if not any(deck.audio_files):
+            self._finish(deck, error="No audio files were created")
+            return
+        print(f"\n[batch] {deck.name}: all audio ready, queueing video encode")
+        if deck.dedup_plan:
+            video_images, video_audio = deck.dedup_plan.segment_sources(deck.slide_images, deck.audio_files)
+        else:
+            video_images, video_audio = deck.slide_images, deck.audio_files
+        self._submit(
+            deck, "encode",
+            lambda result: self._on_encoded(deck, *result),
+            render_final_outputs,
+            video_images, video_audio, deck.video_path, self.profiles, None, deck.temp_dir
+        )
+
+    def _on_encoded(self, deck, video_file, renditions):
+        # Audio-only profile sets write renditions but no main video
+        deck.outputs = [path for path in [video_file, *renditions.values()] if path]
+        self._finish(deck)
+
+    def _finish(self, deck, error=None):
+        if deck.done.is_set():
+            return
+        deck.finished_at = time.perf_counter()
+        deck.error = error
+        deck.succeeded = error is None and any(os.path.exists(path) for path in deck.outputs)
+        if deck.succeeded:
+            print(f"\n[batch] {deck.name}: done in {deck.seconds:.1f}s -> {', '.join(deck.outputs)}")
+        else:
+            print(f"\n[batch] {deck.name}: failed ({error or 'no output was created'})")
+        deck.done.set()
+
+    def shutdown(self):
+        for pool in self.pools.values():
+            pool.shutdown(wait=True)
+        for profile_dir in self._profile_dirs:
+            shutil.rmtree(profile_dir, ignore_errors=True)
+
+
+def print_throughput_report(scheduler, decks, wall_seconds):
+    """Prints aggregate throughput and per-stage utilization for a batch."""
+    succeeded = [d for d in decks if d.succeeded]
+    total_slides = sum(len(d.slide_images) for d in decks)
+    minutes = wall_seconds / 60 if wall_seconds else 0
+
+    print("\n--- Batch Throughput Report ---")
+    print(f"  - Decks: {len(decks)} ({len(succeeded)} succeeded, {len(decks) - len(succeeded)} failed)")
+    print(f"  - Slides: {total_slides}")
+    print(f"  - Wall time: {wall_seconds:.1f}s")
+    if minutes:
+        print(f"  - Throughput: {total_slides / minutes:.1f} slides/min, {len(succeeded) / minutes:.2f} decks/min")
+    print("  - Stage busy time (utilization of its workers):")
+    for stage in STAGES:
+        capacity = scheduler.workers[stage] * wall_seconds
+        utilization = 100 * scheduler.busy_seconds[stage] / capacity if capacity else 0
+        print(f"      {stage:<8} {scheduler.busy_seconds[stage]:>8.1f}s over {scheduler.items[stage]:>4} items, "
+              f"{scheduler.workers[stage]} worker(s), {utilization:.0f}%")
+    text_routed = sum(
+        1 for d in decks for c in (d.slide_contents or []) if c["route"] == "text"
+    )
+    print(f"  - Text-only script prompts: {text_routed}/{total_slides} slides")
+    print("  - Per deck:")
+    for deck in decks:
+        status = "ok" if deck.succeeded else f"FAILED: {deck.error or 'no output was created'}"
+        text_slides = sum(1 for c in (deck.slide_contents or []) if c["route"] == "text")
+        print(f"      {deck.name}: {len(deck.slide_images)} slides ({text_slides} text-only), "
+              f"{deck.seconds:.1f}s, {status}")
+
+
+def run_batch(source, vision_model, tts_engine, rate_limiter,
+              convert_workers=2, script_workers=4, encode_workers=2, profiles=None):
+    """Converts every deck in ``source`` and returns their DeckResults."""
+    paths = discover_decks(source)
+    if paths is None:
+        return None
+
+    valid_paths = [p for p in (resolve_pptx_path(path) for path in paths) if p]
+    if not valid_paths:
+        print("Error: No PowerPoint (.pptx) files found for batch conversion.")
+        return None
+
+    print(f"\n--- Batch: {len(valid_paths)} decks from {source} ---")
+    scheduler = BatchScheduler(
+        vision_model, tts_engine, rate_limiter,
+        convert_workers=convert_workers,
+        script_workers=script_workers,
+        encode_workers=encode_workers,
+        profiles=profiles
+    )
+    start = time.perf_counter()
+    decks = []
+    try:
+        for path in valid_paths:
+            decks.append(scheduler.submit_deck(path))
+        for deck in decks:
+            deck.done.wait()
+    finally:
+        scheduler.shutdown()
+    print_throughput_report(scheduler, decks, time.perf_counter() - start)
+    return decks
+
+
+def parse_args(argv=None):
+    """Parses the batch command line."""
+    parser = argparse.ArgumentParser(
+        description="Convert many PowerPoint presentations into narrated videos in one process.",
+        epilog="Example: python batch_presenter.py course_decks/"
+    )
+    parser.add_argument("source", metavar="DIR_OR_MANIFEST",
+                        help="A directory of .pptx files, or a manifest file listing one path per line")
+    parser.add_argument("--profiles", metavar="LIST",
+                        help=f"Comma-separated output profiles encoded in one pass ({', '.join(OUTPUT_PROFILES)})")
+    parser.add_argument("--convert-workers", type=int, default=2,
+                        help="Parallel LibreOffice conversions (default: 2)")
+    parser.add_argument("--script-workers", type=int, default=4,
+                        help="Parallel Gemini requests (default: 4)")
+    parser.add_argument("--encode-workers", type=int, default=2,
+                        help="Parallel video encodes (default: 2)")
+    args = parser.parse_args(argv)
+    try:
+        args.profiles = parse_profiles(args.profiles)
+    except ValueError as e:
+        parser.error(str(e))
+    return args
+
+
+def main():
+    args = parse_args()
+    vision_model, tts_engine, rate_limiter = init_pipeline()
+    results = run_batch(
+        args.source, vision_model, tts_engine, rate_limiter,
+        convert_workers=args.convert_workers,
+        script_workers=args.script_workers,
+        encode_workers=args.encode_workers,
+        profiles=args.profiles
+    )
+    if results is None or not any(r.succeeded for r in results):
+        sys.exit(1)
+    print("\nBatch finished!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Benchmarks the TTS backends from tts_engines against each other.
+
+For every backend it reports:
+- load time (including the one-time ONNX export on a cold cache)
+- real-time factor (synthesis seconds / audio seconds, lower is better)
+- similarity to the PyTorch reference output
+
+VITS samples noise during inference, so waveforms never match sample by
+sample. Similarity is therefore measured on the long-term average spectrum
+(cosine similarity of mean log-magnitude spectra) plus the duration ratio.
+
+Usage: python benchmark_tts.py [--backends pytorch,onnx,onnx-int8] [--runs 3]
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from tts_engines import DEFAULT_TTS_MODEL, TTS_BACKENDS, create_tts_engine
+
+SAMPLE_TEXTS = [
+    "Welcome to today's presentation on Java arrays.",
+    "An array stores a fixed number of values of the same type in contiguous memory. "
+    "Each element is accessed by its index, starting from zero.",
+    "To summarize, arrays give constant time access by index, but their size cannot change "
+    "once they are created. Thank you for your attention.",
+]
+
+
+def average_log_spectrum(wav, frame_size=1024, hop=256):
+    """Mean log-magnitude spectrum of a waveform."""
+    wav = np.asarray(wav, dtype=np.float32).ravel()
+    if len(wav) < frame_size:
+        wav = np.pad(wav, (0, frame_size - len(wav)))
+    n_frames = 1 + (len(wav) - frame_size) // hop
+    idx = np.arange(frame_size)[None, :] + hop * np.arange(n_frames)[:, None]
+    frames = wav[idx] * np.hanning(frame_size)[None, :]
+    magnitudes = np.abs(np.fft.rfft(frames, axis=1))
+    return np.log1p(magnitudes).mean(axis=0)
+
+
+def spectral_similarity(reference, candidate):
+    """Cosine similarity of the average log spectra of two waveforms."""
+    a = average_log_spectrum(reference)
+    b = average_log_spectrum(candidate)
+    return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b) + 1e-9))
+
+
+def benchmark_backend(backend, model_name, texts, runs):
+    """Loads one backend and times synthesis of ``texts`` over ``runs`` runs."""
+    start = time.perf_counter()
+    engine = create_tts_engine(model_name, backend)
+    load_seconds = time.perf_counter() - start
+
+    # Warm-up run so one-time graph initialisation is not counted
+    engine.synthesize(texts[0])
+
+    synth_seconds = 0.0
+    audio_seconds = 0.0
+    outputs = []
+    for _ in range(runs):
+        outputs = []
+        for text in texts:
+            start = time.perf_counter()
+            wav = np.asarray(engine.synthesize(text), dtype=np.float32).ravel()
+            synth_seconds += time.perf_counter() - start
+            audio_seconds += len(wav) / engine.sample_rate
+            outputs.append(wav)
+
+    return {
+        "backend": backend,
+        "load_seconds": load_seconds,
+        "rtf": synth_seconds / audio_seconds if audio_seconds else float("inf"),
+        "outputs": outputs,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare TTS backend speed and output similarity.")
+    parser.add_argument("--model", default=DEFAULT_TTS_MODEL, help="Coqui model name")
+    parser.add_argument("--backends", default=",".join(TTS_BACKENDS),
+                        help="Comma-separated list of backends to compare")
+    parser.add_argument("--runs", type=int, default=3, help="Timed runs per backend")
+    args = parser.parse_args()
+
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    if "pytorch" not in backends:
+        backends.insert(0, "pytorch")  # Always needed as the similarity reference
+
+    print(f"--- Benchmarking TTS backends for {args.model} ---")
+    results = []
+    for backend in backends:
+        print(f"\n  - Running {backend}...")
+        try:
+            results.append(benchmark_backend(backend, args.model, SAMPLE_TEXTS, args.runs))
+        except Exception as e:
+            print(f"  - {backend} failed: {e}")
+
+    reference = next((r for r in results if r["backend"] == "pytorch"), None)
+    print("\n--- Results ---")
+    print(f"  {'backend':<12}{'load (s)':>10}{'RTF':>8}{'speedup':>10}{'similarity':>12}{'duration':>10}")
+    for result in results:
+        speedup = reference["rtf"] / result["rtf"] if reference else float("nan")
+        if reference:
+            similarity = np.mean([
+                spectral_similarity(ref, out) for ref, out in zip(reference["outputs"], result["outputs"])
+            ])
+            duration = np.mean([
+                len(out) / len(ref) for ref, out in zip(reference["outputs"], result["outputs"])
+            ])
+        else:
+            similarity = duration = float("nan")
+        print(f"  {result['backend']:<12}{result['load_seconds']:>10.2f}{result['rtf']:>8.3f}"
+              f"{speedup:>9.2f}x{similarity:>12.4f}{duration:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
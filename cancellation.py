@@ -0,0 +1,121 @@
+"""
+Cooperative cancellation for conversion jobs.
+
+A CancelToken is created per job and passed down to every stage. Cancelling
+it takes effect at the next checkpoint:
+
+- LibreOffice and ffmpeg subprocesses started through run_cancellable are
+  killed immediately
+- MoviePy encodes stop at the next frame (through CancellableLogger)
+- rate-limiter waits wake up at once
+- Gemini requests and TTS synthesis are checked before they start; a call
+  already in flight cannot be interrupted, so the backend stops waiting for it
+  and discards its result
+
+JobCancelled derives from BaseException, like KeyboardInterrupt, so the
+``except Exception`` fallbacks in the pipeline do not swallow it.
+"""
+
+import subprocess
+import threading
+
+from proglog import ProgressBarLogger
+
+# Seconds a terminated subprocess gets to exit before it is killed
+TERMINATE_GRACE_SECONDS = 2.0
+
+
+class JobCancelled(BaseException):
+    """Raised inside a stage when its job has been cancelled."""
+
+
+class CancelToken:
+    """Thread-safe cancellation flag that also kills registered subprocesses."""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._processes = set()
+        self.abandoned = []  # Futures still running in worker threads after cancellation
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self):
+        """Flags the job as cancelled and terminates its running subprocesses."""
+        self._event.set()
+        with self._lock:
+            processes = list(self._processes)
+        for process in processes:
+            _terminate(process)
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise JobCancelled()
+
+    def wait(self, seconds):
+        """Sleeps up to ``seconds``; raises JobCancelled as soon as the job is cancelled."""
+        if self._event.wait(seconds):
+            raise JobCancelled()
+
+    def register(self, process):
+        with self._lock:
+            self._processes.add(process)
+        if self.cancelled:
+            _terminate(process)
+
+    def unregister(self, process):
+        with self._lock:
+            self._processes.discard(process)
+
+
+def _terminate(process):
+    if process.poll() is not None:
+        return
+    process.terminate()
+    try:
+        process.wait(timeout=TERMINATE_GRACE_SECONDS)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def check_cancelled(cancel_token):
+    """Raises JobCancelled if ``cancel_token`` (which may be None) is cancelled."""
+    if cancel_token is not None:
+        cancel_token.raise_if_cancelled()
+
+
+def run_cancellable(command, cancel_token=None):
+    """
+    Like ``subprocess.run(command, check=True)`` with captured output, but the
+    process is killed as soon as ``cancel_token`` is cancelled, in which case
+    JobCancelled is raised.
+    """
+    if cancel_token is None:
+        return subprocess.run(command, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    cancel_token.raise_if_cancelled()
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    cancel_token.register(process)
+    try:
+        stdout, stderr = process.communicate()
+    finally:
+        cancel_token.unregister(process)
+        if process.poll() is None:
+            _terminate(process)
+    cancel_token.raise_if_cancelled()
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, command, stdout, stderr)
+    return subprocess.CompletedProcess(command, process.returncode, stdout, stderr)
+
+
+class CancellableLogger(ProgressBarLogger):
+    """Silent MoviePy logger that aborts the encode when the job is cancelled."""
+
+    def __init__(self, cancel_token):
+        super().__init__()
+        self.cancel_token = cancel_token
+
+    def bars_callback(self, bar, attr, value, old_value=None):
+        self.cancel_token.raise_if_cancelled()
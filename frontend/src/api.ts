@@ -4,13 +4,24 @@ const API_BASE_URL = 'http://localhost:8000';
 
 export interface JobStatus {
   job_id: string;
-  status: 'pending' | 'processing' | 'completed' | 'failed';
+  status: 'pending' | 'processing' | 'completed' | 'failed' | 'cancelling' | 'cancelled';
   progress: number;
   message: string;
   created_at: string;
   slides_total?: number;
   slides_processed?: number;
   video_url?: string;
+  draft_video_url?: string;
+  profiles?: string[];
+  renditions?: Record<string, string>;
+  voice?: string;
+  text_slides?: number;
+  image_slides?: number;
+  duplicate_slides?: number;
+  priority?: 'high' | 'normal' | 'low';
+  queue_position?: number;
+  eta_seconds?: number;
+  coalesced_requests?: number;
 }
 
 export interface SlideScript {
@@ -28,9 +39,23 @@ const api = axios.create({
   timeout: 30000,
 });
 
-export const uploadPresentation = async (file: File): Promise<JobStatus> => {
+export const uploadPresentation = async (
+  file: File,
+  voice?: string,
+  profiles?: string[],
+  priority?: 'high' | 'normal' | 'low'
+): Promise<JobStatus> => {
   const formData = new FormData();
   formData.append('file', file);
+  if (voice) {
+    formData.append('voice', voice);
+  }
+  if (profiles && profiles.length > 0) {
+    formData.append('profiles', profiles.join(','));
+  }
+  if (priority) {
+    formData.append('priority', priority);
+  }
 
   const response = await api.post('/upload', formData, {
     headers: {
@@ -51,6 +76,16 @@ export const getAllJobs = async (): Promise<JobStatus[]> => {
   return response.data;
 };
 
+export const cancelJob = async (jobId: string): Promise<JobStatus> => {
+  const response = await api.post(`/jobs/${jobId}/cancel`);
+  return response.data;
+};
+
+export const deleteJob = async (jobId: string): Promise<{ message: string }> => {
+  const response = await api.delete(`/jobs/${jobId}`);
+  return response.data;
+};
+
 export const getScripts = async (jobId: string): Promise<SlideScript[]> => {
   const response = await api.get(`/scripts/${jobId}`);
   return response.data;
@@ -68,6 +103,19 @@ export const downloadVideo = (jobId: string): string => {
   return `${API_BASE_URL}/download/${jobId}`;
 };
 
+export const draftVideoUrl = (jobId: string): string => {
+  return `${API_BASE_URL}/download/${jobId}?variant=draft`;
+};
+
+export const getVoices = async (): Promise<{
+  default: string | null;
+  voices: string[];
+  loaded: string[];
+}> => {
+  const response = await api.get('/voices');
+  return response.data;
+};
+
 export const getSlideImageUrl = (jobId: string, slideNumber: number): string => {
   return `${API_BASE_URL}/slides/${jobId}/${slideNumber}`;
 };
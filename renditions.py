@@ -0,0 +1,182 @@
+"""
+Single-pass multi-rendition encoding.
+
+Rendering several output sizes with MoviePy means re-reading every slide and
+audio file once per size. Here ffmpeg is driven directly instead: the slide
+images and narrations are decoded once, the video stream is split and scaled
+per profile inside one filter graph, and every rendition (plus an optional
+audio-only track for podcasts) is written by the same ffmpeg process.
+"""
+
+import os
+import subprocess
+import wave
+
+from cancellation import JobCancelled, run_cancellable
+
+# Output profiles: video profiles are scaled to ``height``; "audio" is audio-only
+OUTPUT_PROFILES = {
+    "1080p": {"height": 1080, "crf": 23, "audio_bitrate": "128k"},
+    "720p": {"height": 720, "crf": 23, "audio_bitrate": "128k"},
+    "480p": {"height": 480, "crf": 26, "audio_bitrate": "96k"},
+    "audio": {"audio_only": True, "audio_bitrate": "96k"},
+}
+
+
+def parse_profiles(value):
+    """
+    Parses a comma-separated profile list such as "1080p,720p,audio".
+    Returns the profile names in order, or raises ValueError for unknown ones.
+    """
+    names = []
+    for name in (value or "").split(","):
+        name = name.strip().lower()
+        if not name or name in names:
+            continue
+        if name not in OUTPUT_PROFILES:
+            raise ValueError(f"Unknown output profile '{name}'. Choose from: {', '.join(OUTPUT_PROFILES)}")
+        names.append(name)
+    return names
+
+
+def rendition_path(video_output_path, profile):
+    """Returns the file a profile is written to, next to the main video."""
+    base = os.path.splitext(video_output_path)[0]
+    if OUTPUT_PROFILES[profile].get("audio_only"):
+        return f"{base}_audio.m4a"
+    return f"{base}_{profile}.mp4"
+
+
+def get_ffmpeg_binary():
+    """Returns the ffmpeg executable MoviePy uses, falling back to the one on PATH."""
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        return "ffmpeg"
+
+
+def wav_duration(path):
+    """Duration of a WAV file in seconds."""
+    with wave.open(path, "rb") as wav:
+        return wav.getnframes() / float(wav.getframerate())
+
+
+def _concat_line(path):
+    return "file '" + os.path.abspath(path).replace("'", "'\\''") + "'\n"
+
+
+def build_rendition_command(image_list, audio_list, outputs, fps=24):
+    """
+    Builds the ffmpeg command encoding every (profile, partial path) in
+    ``outputs`` from the two concat lists in a single pass.
+    """
+    command = [
+        get_ffmpeg_binary(), "-y", "-hide_banner", "-loglevel", "error",
+        "-f", "concat", "-safe", "0", "-i", image_list,
+        "-f", "concat", "-safe", "0", "-i", audio_list,
+    ]
+    video_outputs = [(p, path) for p, path in outputs if not OUTPUT_PROFILES[p].get("audio_only")]
+    if video_outputs:
+        # Decode once, then split and scale per rendition
+        labels = "".join(f"[s{i}]" for i in range(len(video_outputs)))
+        graph = [f"[0:v]fps={fps},split={len(video_outputs)}{labels}"]
+        for i, (profile, _) in enumerate(video_outputs):
+            height = OUTPUT_PROFILES[profile]["height"]
+            graph.append(f"[s{i}]scale=-2:{height}:flags=lanczos,setsar=1,format=yuv420p[v{i}]")
+        command += ["-filter_complex", ";".join(graph)]
+
+    video_index = 0
+    for profile, path in outputs:
+        settings = OUTPUT_PROFILES[profile]
+        if settings.get("audio_only"):
+            command += ["-map", "1:a", "-vn", "-c:a", "aac", "-b:a", settings["audio_bitrate"],
+                        "-movflags", "+faststart", path]
+            continue
+        command += [
+            "-map", f"[v{video_index}]", "-map", "1:a",
+            "-c:v", "libx264", "-preset", "medium", "-crf", str(settings["crf"]), "-tune", "stillimage",
+            "-c:a", "aac", "-b:a", settings["audio_bitrate"],
+            "-movflags", "+faststart", "-shortest", path,
+        ]
+        video_index += 1
+    return command
+
+
+def _remove_partials(outputs):
+    for _, partial_path in outputs:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+
+
+def encode_renditions(image_files, audio_files, video_output_path, profiles, fps=24, cancel_token=None, work_dir=None):
+    """
+    Encodes every profile in ``profiles`` from one decode of the slides.
+    Slides without audio are skipped, as in create_video_with_moviepy. The
+    concat lists go to work_dir (default: next to the output).
+    Returns {profile: output path} for the renditions that were written.
+    Cancelling cancel_token kills ffmpeg and raises JobCancelled.
+    """
+    print(f"\nStep 4: Encoding {', '.join(profiles)} in a single ffmpeg pass...")
+    slides = []
+    for img_path, audio_path in zip(image_files, audio_files):
+        if not os.path.exists(img_path):
+            print(f"  - Warning: Missing image {img_path}. Skipping slide.")
+            continue
+        if not audio_path or not os.path.exists(audio_path):
+            print(f"  - Warning: Missing audio for {os.path.basename(img_path)}. Skipping slide.")
+            continue
+        slides.append((img_path, audio_path, wav_duration(audio_path)))
+    if not slides:
+        print("  - No slides with audio. Cannot encode renditions.")
+        return {}
+
+    base = os.path.splitext(video_output_path)[0]
+    if work_dir:
+        base = os.path.join(work_dir, os.path.basename(base))
+    image_list = f"{base}_images.ffconcat"
+    audio_list = f"{base}_audio.ffconcat"
+    with open(image_list, "w", encoding="utf-8") as f:
+        f.write("ffconcat version 1.0\n")
+        for img_path, _, duration in slides:
+            f.write(_concat_line(img_path))
+            f.write(f"duration {duration:.6f}\n")
+        # The concat demuxer ignores the last duration unless the file is repeated
+        f.write(_concat_line(slides[-1][0]))
+    with open(audio_list, "w", encoding="utf-8") as f:
+        f.write("ffconcat version 1.0\n")
+        for _, audio_path, _ in slides:
+            f.write(_concat_line(audio_path))
+
+    outputs = []
+    for profile in profiles:
+        final_path = rendition_path(video_output_path, profile)
+        root, ext = os.path.splitext(final_path)
+        outputs.append((profile, f"{root}.partial{ext}"))
+
+    command = build_rendition_command(image_list, audio_list, outputs, fps)
+    try:
+        run_cancellable(command, cancel_token)
+    except JobCancelled:
+        print("  - Rendition encoding cancelled.")
+        _remove_partials(outputs)
+        raise
+    except (subprocess.CalledProcessError, FileNotFoundError) as e:
+        stderr = getattr(e, "stderr", b"") or b""
+        print(f"  - Error during rendition encoding: {e}")
+        if stderr:
+            print(f"  - ffmpeg: {stderr.decode(errors='replace').strip()[-500:]}")
+        _remove_partials(outputs)
+        return {}
+    finally:
+        for list_path in (image_list, audio_list):
+            if os.path.exists(list_path):
+                os.remove(list_path)
+
+    written = {}
+    for profile, partial_path in outputs:
+        final_path = rendition_path(video_output_path, profile)
+        os.replace(partial_path, final_path)
+        written[profile] = final_path
+        print(f"  - {profile}: {final_path} ({os.path.getsize(final_path)} bytes)")
+    return written
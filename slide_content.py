@@ -0,0 +1,218 @@
+"""
+Slide text mining and routing for script generation.
+
+Text-only bullet slides do not need the vision model: their text layer (from
+the PDF that LibreOffice exports) plus any speaker notes (from the PPTX)
+carry everything the script needs, and a text prompt is far cheaper than
+uploading a 300-DPI image. Each slide is classified as:
+
+- ``text`` : enough extractable text and little visual content, so the
+             script is generated from a text-only prompt
+- ``image``: diagrams, photos, charts or too little text, so the rendered
+             slide image is uploaded as before
+"""
+
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+
+import fitz  # PyMuPDF
+
+# Classification thresholds
+MIN_TEXT_WORDS = 8           # Fewer words than this and the image is needed for context
+MAX_IMAGE_COVERAGE = 0.15    # Fraction of the page covered by raster images
+MAX_DRAWING_COVERAGE = 0.25  # Fraction of the page covered by vector shapes (diagrams, charts)
+BACKGROUND_COVERAGE = 0.9    # Shapes covering more than this are treated as backgrounds
+
+_NS = {
+    "p": "http://schemas.openxmlformats.org/presentationml/2006/main",
+    "a": "http://schemas.openxmlformats.org/drawingml/2006/main",
+    "r": "http://schemas.openxmlformats.org/officeDocument/2006/relationships",
+    "rel": "http://schemas.openxmlformats.org/package/2006/relationships",
+}
+
+
+def _clean_text(text):
+    """Collapses whitespace in extracted text."""
+    return re.sub(r"[ \t]+", " ", re.sub(r"\s*\n\s*", "\n", text or "")).strip()
+
+
+def _read_rels(archive, rels_path):
+    """Returns {relationship id: target} for a .rels part, or {} if missing."""
+    try:
+        root = ET.fromstring(archive.read(rels_path))
+    except KeyError:
+        return {}
+    return {rel.get("Id"): rel.get("Target") for rel in root.findall("rel:Relationship", _NS)}
+
+
+def _resolve_target(base_dir, target):
+    """Resolves a relationship target relative to the part's directory."""
+    parts = (base_dir + "/" + target).split("/") if not target.startswith("/") else target[1:].split("/")
+    resolved = []
+    for part in parts:
+        if part == "..":
+            if resolved:
+                resolved.pop()
+        elif part and part != ".":
+            resolved.append(part)
+    return "/".join(resolved)
+
+
+def extract_speaker_notes(pptx_path):
+    """
+    Returns the speaker notes of each visible slide, in presentation order.
+
+    Hidden slides are skipped because LibreOffice leaves them out of the PDF
+    export, so the list lines up with the extracted slide images. Slides
+    without notes get an empty string.
+    """
+    notes = []
+    try:
+        with zipfile.ZipFile(pptx_path) as archive:
+            presentation = ET.fromstring(archive.read("ppt/presentation.xml"))
+            presentation_rels = _read_rels(archive, "ppt/_rels/presentation.xml.rels")
+            for slide_id in presentation.findall("p:sldIdLst/p:sldId", _NS):
+                slide_part = _resolve_target("ppt", presentation_rels.get(slide_id.get(f"{{{_NS['r']}}}id"), ""))
+                slide = ET.fromstring(archive.read(slide_part))
+                if slide.get("show") == "0":
+                    continue
+
+                slide_dir, slide_name = slide_part.rsplit("/", 1)
+                slide_rels = _read_rels(archive, f"{slide_dir}/_rels/{slide_name}.rels")
+                notes_part = next(
+                    (_resolve_target(slide_dir, target) for target in slide_rels.values()
+                     if "notesSlide" in target),
+                    None
+                )
+                notes.append(_read_notes_text(archive, notes_part) if notes_part else "")
+    except (OSError, KeyError, zipfile.BadZipFile, ET.ParseError) as e:
+        print(f"  - Could not read speaker notes from {pptx_path}: {e}")
+    return notes
+
+
+def _read_notes_text(archive, notes_part):
+    """Returns the text of the body placeholder of a notes slide."""
+    try:
+        root = ET.fromstring(archive.read(notes_part))
+    except KeyError:
+        return ""
+    paragraphs = []
+    for shape in root.iter(f"{{{_NS['p']}}}sp"):
+        placeholder = shape.find("p:nvSpPr/p:nvPr/p:ph", _NS)
+        if placeholder is None or placeholder.get("type") != "body":
+            continue
+        for paragraph in shape.iter(f"{{{_NS['a']}}}p"):
+            text = "".join(t.text or "" for t in paragraph.iter(f"{{{_NS['a']}}}t")).strip()
+            if text:
+                paragraphs.append(text)
+    return "\n".join(paragraphs)
+
+
+def _union_area(boxes):
+    """Area covered by the union of ``boxes`` ((x0, y0, x1, y1) tuples), counting overlaps once."""
+    events = sorted(
+        [(x0, 1, i) for i, (x0, _, x1, _) in enumerate(boxes)]
+        + [(x1, -1, i) for i, (x0, _, x1, _) in enumerate(boxes)]
+    )
+    active = set()
+    area = 0.0
+    previous_x = None
+    for x, kind, i in events:
+        if active and x > previous_x:
+            # Merge the y-intervals of the boxes spanning this vertical strip
+            covered, top, bottom = 0.0, None, None
+            for y0, y1 in sorted((boxes[j][1], boxes[j][3]) for j in active):
+                if bottom is None or y0 > bottom:
+                    if bottom is not None:
+                        covered += bottom - top
+                    top, bottom = y0, y1
+                else:
+                    bottom = max(bottom, y1)
+            covered += bottom - top
+            area += covered * (x - previous_x)
+        previous_x = x
+        if kind > 0:
+            active.add(i)
+        else:
+            active.discard(i)
+    return area
+
+
+def _coverage(rects, page_area):
+    """Fraction of the page covered by ``rects``, ignoring full-page backgrounds."""
+    boxes = []
+    for rect in rects:
+        x0, x1 = sorted((rect.x0, rect.x1))
+        y0, y1 = sorted((rect.y0, rect.y1))
+        area = (x1 - x0) * (y1 - y0)
+        if area <= 0 or area >= BACKGROUND_COVERAGE * page_area:
+            continue
+        boxes.append((x0, y0, x1, y1))
+    # Shapes often overlap (stacked boxes, chart gridlines); count shared area once
+    return min(_union_area(boxes) / page_area, 1.0) if page_area else 0.0
+
+
+def classify_slide(content):
+    """Returns "text" when the slide can be scripted from its text alone, else "image"."""
+    if content["word_count"] < MIN_TEXT_WORDS:
+        return "image"
+    if content["image_coverage"] > MAX_IMAGE_COVERAGE:
+        return "image"
+    if content["drawing_coverage"] > MAX_DRAWING_COVERAGE:
+        return "image"
+    return "text"
+
+
+def analyze_slide_content(pdf_path, pptx_path=None):
+    """
+    Mines the exported PDF (and the PPTX speaker notes, when available) for
+    each slide's text and visual coverage, and routes it to a prompt type.
+
+    Returns one dict per page with keys: text, notes, word_count,
+    image_coverage, drawing_coverage and route ("text" or "image").
+    """
+    notes = extract_speaker_notes(pptx_path) if pptx_path else []
+    contents = []
+    doc = fitz.open(pdf_path)
+    try:
+        for i, page in enumerate(doc):
+            page_area = abs(page.rect.width * page.rect.height)
+            text = _clean_text(page.get_text("text"))
+            image_rects = [fitz.Rect(info["bbox"]) for info in page.get_image_info()]
+            drawing_rects = [drawing["rect"] for drawing in page.get_drawings()]
+            content = {
+                "text": text,
+                "notes": notes[i] if i < len(notes) else "",
+                "word_count": len(text.split()),
+                "image_coverage": _coverage(image_rects, page_area),
+                "drawing_coverage": _coverage(drawing_rects, page_area),
+            }
+            content["route"] = classify_slide(content)
+            contents.append(content)
+    finally:
+        doc.close()
+    return contents
+
+
+def print_route_summary(contents, label="deck"):
+    """Prints how many slides of a deck take the text-only path."""
+    if not contents:
+        return
+    text_slides = sum(1 for c in contents if c["route"] == "text")
+    image_slides = len(contents) - text_slides
+    with_notes = sum(1 for c in contents if c["notes"])
+    print(f"\n--- Script Generation Routing ({label}) ---")
+    print(f"  - Text-only prompts: {text_slides} slides")
+    print(f"  - Image prompts: {image_slides} slides")
+    print(f"  - Slides with speaker notes: {with_notes}")
+    print(f"  - Image uploads avoided: {text_slides}/{len(contents)} ({100 * text_slides // len(contents)}%)")
+
+
+def count_slides(pptx_path):
+    """Counts the slides in a .pptx without rendering it (a cheap size hint)."""
+    try:
+        with zipfile.ZipFile(pptx_path) as archive:
+            return sum(1 for name in archive.namelist() if re.fullmatch(r"ppt/slides/slide\d+\.xml", name))
+    except (OSError, zipfile.BadZipFile):
+        return 0
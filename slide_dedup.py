@@ -0,0 +1,226 @@
+"""
+Perceptual-hash deduplication of near-identical slides.
+
+LibreOffice exports every animation build step and every repeated section
+divider as its own page. Each page is hashed with a DCT perceptual hash
+(computed for the whole deck at once with NumPy) and pages within a small
+Hamming distance are clustered. What happens to a cluster depends on the
+policy:
+
+- ``off``  : every slide is processed on its own
+- ``reuse``: duplicates copy the script and audio of the first slide in their
+             cluster instead of calling Gemini and TTS again; exact duplicates
+             also share one video segment
+- ``merge``: like ``reuse``, and consecutive near-identical slides (animation
+             builds) collapse into a single segment showing the final build
+
+The PDF text layer guards every cluster: slides are only clustered when
+both have text and it matches (or, for builds, only grows), so two section
+dividers with different titles, or two image-only charts on the same
+template, are never merged.
+"""
+
+import filecmp
+import re
+
+import fitz  # PyMuPDF
+import numpy as np
+
+DEDUP_POLICIES = ("off", "reuse", "merge")
+DEFAULT_THRESHOLD = 6  # Max differing bits (out of 64) for slides to count as near-identical
+HASH_DPI = 24          # Render resolution used for hashing; tiny is enough
+HASH_SIZE = 32         # Side of the downscaled image the DCT runs on
+HASH_BITS_SIDE = 8     # Low-frequency block kept from the DCT (8x8 = 64 bits)
+
+
+def _dct_matrix(n):
+    """Orthonormal DCT-II matrix of size n x n."""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+
+def _resize_mean(image, size):
+    """Downscales a 2-D array to size x size by averaging pixel blocks."""
+    h, w = image.shape
+    rows = np.linspace(0, h, size + 1).astype(int)[:-1]
+    cols = np.linspace(0, w, size + 1).astype(int)[:-1]
+    sums = np.add.reduceat(np.add.reduceat(image, rows, axis=0), cols, axis=1)
+    counts = np.outer(np.diff(np.append(rows, h)), np.diff(np.append(cols, w)))
+    return sums / counts
+
+
+def render_page_thumbnails(pdf_path, dpi=HASH_DPI, size=HASH_SIZE):
+    """Renders every PDF page as a size x size grayscale float array (N, size, size)."""
+    thumbnails = []
+    doc = fitz.open(pdf_path)
+    try:
+        for page in doc:
+            pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY, alpha=False)
+            pixels = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.stride)[:, :pix.width]
+            thumbnails.append(_resize_mean(pixels.astype(np.float64), size))
+    finally:
+        doc.close()
+    if not thumbnails:
+        return np.zeros((0, size, size))
+    return np.stack(thumbnails)
+
+
+def perceptual_hashes(thumbnails):
+    """
+    Computes 64-bit DCT perceptual hashes for a stack of thumbnails.
+    Returns a boolean array of shape (N, 64).
+    """
+    n, size, _ = thumbnails.shape
+    dct = _dct_matrix(size)
+    coefficients = np.einsum("ij,njk,lk->nil", dct, thumbnails, dct)
+    low = coefficients[:, :HASH_BITS_SIDE, :HASH_BITS_SIDE].reshape(n, -1)
+    # The DC term only reflects overall brightness, so it is left out of the median
+    medians = np.median(low[:, 1:], axis=1)
+    return low > medians[:, None]
+
+
+def hamming_distances(hashes):
+    """Pairwise Hamming distances between all hashes, shape (N, N)."""
+    return (hashes[:, None, :] != hashes[None, :, :]).sum(axis=2)
+
+
+def extract_page_texts(pdf_path):
+    """Returns the text layer of every PDF page."""
+    doc = fitz.open(pdf_path)
+    try:
+        return [page.get_text("text") for page in doc]
+    finally:
+        doc.close()
+
+
+def _words(text):
+    return re.findall(r"\w+", (text or "").lower())
+
+
+def _same_text(a, b):
+    """True if both slides have text and it is the same; slides without text never match."""
+    words = _words(a)
+    return bool(words) and words == _words(b)
+
+
+def _is_build_step(earlier, later):
+    """True if ``later`` only adds words to ``earlier``, as an animation build does."""
+    if not _words(earlier):
+        return False
+    remaining = list(_words(later))
+    for word in _words(earlier):
+        if word not in remaining:
+            return False
+        remaining.remove(word)
+    return True
+
+
+class DedupPlan:
+    """
+    Which slides to process, reuse or drop.
+
+    ``sources[i]`` is the index of the slide whose script and audio slide
+    ``i`` reuses (``i`` itself for slides processed normally), and
+    ``merged_into[i]`` is the index of the slide that replaces a dropped
+    build step.
+    """
+
+    def __init__(self, policy, sources, merged_into, distances):
+        self.policy = policy
+        self.sources = sources
+        self.merged_into = merged_into
+        self.distances = distances
+
+    def source_of(self, index):
+        return self.sources[index]
+
+    def is_dropped(self, index):
+        return index in self.merged_into
+
+    def is_exact_duplicate(self, index):
+        source = self.sources[index]
+        return source != index and self.distances is not None and self.distances[index, source] == 0
+
+    def print_summary(self):
+        reused = sum(1 for i, s in enumerate(self.sources) if s != i and i not in self.merged_into)
+        total = len(self.sources)
+        print(f"\n--- Slide Deduplication ({self.policy}) ---")
+        print(f"  - Slides: {total}")
+        print(f"  - Reusing script/audio of an earlier slide: {reused}")
+        print(f"  - Merged animation build steps: {len(self.merged_into)}")
+        print(f"  - Gemini/TTS runs avoided: {reused + len(self.merged_into)}/{total}")
+
+    def segment_sources(self, slide_images, audio_files):
+        """
+        Returns (images, audio) for video assembly. Merged build steps are left
+        out, and exact duplicates point at their source slide's files so the
+        encoder can reuse one segment. Duplicates whose audio was regenerated
+        after an edit keep their own files.
+        """
+        images = []
+        audio = []
+        for i, (image_path, audio_path) in enumerate(zip(slide_images, audio_files)):
+            if self.is_dropped(i):
+                continue
+            source = self.sources[i]
+            if (self.is_exact_duplicate(i) and audio_path and audio_files[source]
+                    and filecmp.cmp(audio_path, audio_files[source], shallow=False)):
+                image_path = slide_images[source]
+                audio_path = audio_files[source]
+            images.append(image_path)
+            audio.append(audio_path)
+        return images, audio
+
+
+def plan_deduplication(pdf_path, policy="reuse", threshold=DEFAULT_THRESHOLD, texts=None):
+    """
+    Hashes every page of the exported PDF and clusters near-identical slides
+    according to ``policy``. Clustered slides must also have matching,
+    non-empty text; ``texts`` (one string per slide) saves re-reading it from
+    the PDF.
+    """
+    if policy not in DEDUP_POLICIES:
+        raise ValueError(f"Unknown dedup policy '{policy}'. Choose one of: {', '.join(DEDUP_POLICIES)}")
+
+    thumbnails = render_page_thumbnails(pdf_path)
+    count = len(thumbnails)
+    if policy == "off" or count == 0:
+        return DedupPlan(policy, list(range(count)), {}, None)
+
+    if texts is None or len(texts) != count:
+        texts = extract_page_texts(pdf_path)
+    distances = hamming_distances(perceptual_hashes(thumbnails))
+    near = distances <= threshold
+
+    # Consecutive build steps collapse into the last slide of their run
+    merged_into = {}
+    if policy == "merge":
+        run_start = 0
+        for i in range(1, count + 1):
+            continues = (
+                i < count and near[i - 1, i]
+                and _is_build_step(texts[i - 1], texts[i])
+            )
+            if not continues:
+                for j in range(run_start, i - 1):
+                    merged_into[j] = i - 1
+                run_start = i
+
+    # Remaining slides reuse the first earlier slide of their cluster
+    sources = list(range(count))
+    for i in range(count):
+        if i in merged_into:
+            sources[i] = merged_into[i]
+            continue
+        for j in range(i):
+            if j in merged_into or sources[j] != j or not near[i, j]:
+                continue
+            if not _same_text(texts[i], texts[j]):
+                continue
+            sources[i] = j
+            break
+
+    return DedupPlan(policy, sources, merged_into, distances)
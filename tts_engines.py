@@ -0,0 +1,411 @@
+"""
+Pluggable text-to-speech engines for the presenter pipeline.
+
+Every engine exposes the same ``tts_to_file(text=..., file_path=...)`` method
+as Coqui's ``TTS`` object, so ``synthesize_speech_with_coqui`` works with any
+of them unchanged. Available backends:
+
+- ``pytorch``  : stock Coqui TTS inference (full precision PyTorch)
+- ``onnx``     : the VITS model exported once to ONNX and run with ONNX Runtime
+- ``onnx-int8``: the exported ONNX graph with dynamic int8 weight quantization
+
+The ONNX backends only apply to VITS models. Exported graphs are cached on
+disk (``TTS_ENGINE_CACHE_DIR``) so the export cost is paid once per model.
+
+``TTSModelRegistry`` loads voices on demand and keeps the most recently used
+ones in memory under a budget, sharing each loaded model between callers.
+"""
+
+import os
+import re
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+
+DEFAULT_TTS_MODEL = "tts_models/en/ljspeech/vits"
+TTS_BACKENDS = ("pytorch", "onnx", "onnx-int8")
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "powerpoint-to-video", "tts")
+DEFAULT_MEMORY_BUDGET_MB = 2048
+
+# Pause inserted between sentences by the ONNX backends (Coqui does the same)
+SENTENCE_SILENCE_SECONDS = 0.25
+
+
+class TTSEngine(ABC):
+    """Base class for TTS engines. Subclasses implement ``synthesize`` and ``tts_to_file``."""
+
+    backend = None
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+        self.sample_rate = None
+        # Models are shared between jobs; inference is serialized per engine
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def synthesize(self, text):
+        """Returns the waveform for ``text`` as a list/array of float samples."""
+
+    @abstractmethod
+    def tts_to_file(self, text, file_path):
+        """Synthesizes ``text`` and writes it as a WAV file, mirroring Coqui's API."""
+
+    def synthesize_stream(self, sentences, file_path, slot=None):
+        """
+        Synthesizes each sentence as the iterable ``sentences`` yields it and
+        appends it to the WAV file at ``file_path`` right away, so the file is
+        complete as soon as the last sentence is spoken. The lock is taken
+        per sentence, letting other jobs interleave on a shared engine, and
+        so is ``slot()`` (a context manager for an external limit) if given. The
+        finished file is peak-normalized like ``save_wav``, so streamed slides
+        are as loud as the others. Returns ``file_path``, or None (and no
+        file) if no text arrived.
+        """
+        import wave
+        import numpy as np
+        writer = None
+        try:
+            for sentence in sentences:
+                if not sentence.strip():
+                    continue
+                with slot() if slot else nullcontext(), self._lock:
+                    wav = np.asarray(self.synthesize(sentence), dtype=np.float32).ravel()
+                if writer is None:
+                    writer = wave.open(file_path, "wb")
+                    writer.setnchannels(1)
+                    writer.setsampwidth(2)
+                    writer.setframerate(self.sample_rate)
+                # The peak of the later sentences is not known yet; normalized at the end
+                writer.writeframes((np.clip(wav, -1.0, 1.0) * 32767).astype(np.int16).tobytes())
+        finally:
+            if writer is not None:
+                writer.close()
+        if writer is None:
+            return None
+        normalize_wav(file_path)
+        return file_path
+
+    def save_wav(self, wav, file_path):
+        """Writes a waveform from ``synthesize`` as a 16-bit WAV file, peak-normalized like Coqui."""
+        import wave
+        import numpy as np
+        wav = np.asarray(wav, dtype=np.float32).ravel()
+        wav = wav * (32767 / max(0.01, float(np.max(np.abs(wav))) if wav.size else 0.0))
+        with wave.open(file_path, "wb") as writer:
+            writer.setnchannels(1)
+            writer.setsampwidth(2)
+            writer.setframerate(self.sample_rate)
+            writer.writeframes(wav.astype(np.int16).tobytes())
+        return file_path
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.model_name!r})"
+
+
+class CoquiTTSEngine(TTSEngine):
+    """Stock Coqui TTS inference in PyTorch."""
+
+    backend = "pytorch"
+
+    def __init__(self, model_name=DEFAULT_TTS_MODEL):
+        super().__init__(model_name)
+        from TTS.api import TTS
+        self.tts = TTS(model_name, progress_bar=False)
+        self.synthesizer = self.tts.synthesizer
+        self.sample_rate = self.synthesizer.output_sample_rate
+
+    def synthesize(self, text):
+        return self.tts.tts(text=text)
+
+    def tts_to_file(self, text, file_path):
+        with self._lock:
+            self.tts.tts_to_file(text=text, file_path=file_path)
+        return file_path
+
+
+class OnnxVitsTTSEngine(TTSEngine):
+    """
+    Runs a Coqui VITS model through ONNX Runtime on CPU.
+
+    Only the model's config and tokenizer are loaded for inference. The
+    PyTorch checkpoint is loaded just once, to export the ONNX graph when it
+    is not cached yet, and released afterwards. With ``quantize=True`` the
+    exported graph is additionally converted to dynamic int8 weights.
+    """
+
+    backend = "onnx"
+
+    def __init__(self, model_name=DEFAULT_TTS_MODEL, quantize=False, cache_dir=None, num_threads=None):
+        super().__init__(model_name)
+        import numpy as np
+        import onnxruntime as ort
+        import pysbd
+        from TTS.config import load_config
+        from TTS.tts.utils.text.tokenizer import TTSTokenizer
+        from TTS.utils.manage import ModelManager
+
+        self._np = np
+        self.quantize = quantize
+        if quantize:
+            self.backend = "onnx-int8"
+        self.cache_dir = cache_dir or os.getenv("TTS_ENGINE_CACHE_DIR", DEFAULT_CACHE_DIR)
+
+        checkpoint_path, config_path, _ = ModelManager(progress_bar=False).download_model(model_name)
+        config = load_config(config_path)
+        if config.model != "vits":
+            raise ValueError(f"Model {model_name} is not a VITS model and cannot be exported to ONNX")
+        self.tokenizer, config = TTSTokenizer.init_from_config(config)
+        self.sample_rate = config.audio["sample_rate"]
+        args = config.model_args
+        self._scales = np.array(
+            [args.inference_noise_scale, args.length_scale, args.inference_noise_scale_dp], dtype=np.float32
+        )
+        # Same sentence splitter as Coqui's Synthesizer; model names look like tts_models/<lang>/...
+        parts = model_name.split("/")
+        try:
+            self._segmenter = pysbd.Segmenter(language=parts[1] if len(parts) > 2 else "en", clean=True)
+        except ValueError:
+            self._segmenter = pysbd.Segmenter(language="en", clean=True)
+
+        def load_vits():
+            from TTS.tts.models.vits import Vits
+            vits = Vits.init_from_config(config)
+            vits.load_checkpoint(config, checkpoint_path, eval=True)
+            return vits
+
+        onnx_path = get_cached_onnx_model(load_vits, model_name, self.cache_dir, quantize=quantize)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads or os.getenv("TTS_ONNX_THREADS"):
+            options.intra_op_num_threads = int(num_threads or os.getenv("TTS_ONNX_THREADS"))
+        self.session = ort.InferenceSession(
+            onnx_path, sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self._input_names = {i.name for i in self.session.get_inputs()}
+        self.onnx_path = onnx_path
+
+    def _infer(self, ids):
+        """Runs the exported graph the way Coqui's Vits.inference_onnx does."""
+        np = self._np
+        feed = {
+            "input": ids,
+            "input_lengths": np.array([ids.shape[1]], dtype=np.int64),
+            "scales": self._scales,
+        }
+        if "sid" in self._input_names:
+            feed["sid"] = np.zeros(1, dtype=np.int64)  # First speaker of multi-speaker models
+        return self.session.run(["output"], feed)[0][0]
+
+    def synthesize(self, text):
+        np = self._np
+        silence = np.zeros(int(self.sample_rate * SENTENCE_SILENCE_SECONDS), dtype=np.float32)
+        pieces = []
+        for sentence in self._segmenter.segment(text):
+            if not sentence.strip():
+                continue
+            ids = np.asarray(self.tokenizer.text_to_ids(sentence), dtype=np.int64)[None, :]
+            audio = np.asarray(self._infer(ids), dtype=np.float32).squeeze()
+            pieces.append(audio)
+            pieces.append(silence)
+        if not pieces:
+            return silence
+        return np.concatenate(pieces)
+
+    def tts_to_file(self, text, file_path):
+        with self._lock:
+            wav = self.synthesize(text)
+        return self.save_wav(wav, file_path)
+
+
+def normalize_wav(file_path):
+    """Rescales a 16-bit mono WAV file in place with the same peak normalization as ``save_wav``."""
+    import wave
+    import numpy as np
+    with wave.open(file_path, "rb") as reader:
+        params = reader.getparams()
+        samples = np.frombuffer(reader.readframes(reader.getnframes()), dtype=np.int16)
+    if not samples.size:
+        return
+    peak = float(np.max(np.abs(samples.astype(np.float32)))) / 32767
+    scaled = samples.astype(np.float32) * (1 / max(0.01, peak))
+    with wave.open(file_path, "wb") as writer:
+        writer.setparams(params)
+        writer.writeframes(np.clip(scaled, -32767, 32767).astype(np.int16).tobytes())
+
+
+_export_lock = threading.Lock()
+
+
+def _cache_name(model_name):
+    """Turns a Coqui model name into a safe file name."""
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name).strip("_")
+
+
+def get_cached_onnx_model(load_vits, model_name, cache_dir, quantize=False):
+    """
+    Returns the path of the exported (and optionally int8-quantized) ONNX
+    graph for ``model_name``, exporting it on the first call only.
+    ``load_vits`` returns the PyTorch model and is only called to export.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    base = os.path.join(cache_dir, _cache_name(model_name))
+    fp32_path = base + ".onnx"
+    int8_path = base + ".int8.onnx"
+
+    with _export_lock:
+        if not os.path.exists(fp32_path):
+            print(f"  - Exporting {model_name} to ONNX (one-time step)...")
+            tmp_path = fp32_path + ".tmp"
+            load_vits().export_onnx(output_path=tmp_path, verbose=False)
+            os.replace(tmp_path, fp32_path)
+            print(f"  - ONNX model cached at: {fp32_path}")
+
+        if not quantize:
+            return fp32_path
+
+        if not os.path.exists(int8_path):
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            print("  - Quantizing ONNX model to int8 (one-time step)...")
+            tmp_path = int8_path + ".tmp"
+            quantize_dynamic(fp32_path, tmp_path, weight_type=QuantType.QInt8)
+            os.replace(tmp_path, int8_path)
+            print(f"  - Quantized model cached at: {int8_path}")
+        return int8_path
+
+
+def create_tts_engine(model_name=DEFAULT_TTS_MODEL, backend="pytorch"):
+    """Creates a TTS engine for ``model_name`` using the requested backend."""
+    backend = (backend or "pytorch").lower()
+    if backend == "pytorch":
+        return CoquiTTSEngine(model_name)
+    if backend == "onnx":
+        return OnnxVitsTTSEngine(model_name)
+    if backend == "onnx-int8":
+        return OnnxVitsTTSEngine(model_name, quantize=True)
+    raise ValueError(f"Unknown TTS backend '{backend}'. Choose one of: {', '.join(TTS_BACKENDS)}")
+
+
+def estimate_engine_memory(engine):
+    """Approximate resident size of a loaded engine in bytes."""
+    total = 0
+    model = getattr(getattr(getattr(engine, "tts", None), "synthesizer", None), "tts_model", None)
+    if model is not None and hasattr(model, "parameters"):
+        for tensor in list(model.parameters()) + list(model.buffers()):
+            total += tensor.numel() * tensor.element_size()
+    onnx_path = getattr(engine, "onnx_path", None)
+    if onnx_path and os.path.exists(onnx_path):
+        total += os.path.getsize(onnx_path)
+    return total
+
+
+class TTSModelRegistry:
+    """
+    Loads TTS voices on demand and keeps an LRU of loaded models.
+
+    A voice is a Coqui model name. The same voice is loaded only once, even
+    when several jobs ask for it at the same time, and the loaded engine is
+    shared between them. Once the estimated memory of the loaded models
+    exceeds ``memory_budget_mb``, least recently used voices that are not
+    currently in use are unloaded.
+    """
+
+    def __init__(self, backend="pytorch", memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB,
+                 allowed_voices=None, default_voice=DEFAULT_TTS_MODEL, loader=create_tts_engine):
+        self.backend = backend
+        self.memory_budget = int(memory_budget_mb * 1024 * 1024)
+        self.default_voice = default_voice
+        self.allowed_voices = list(allowed_voices) if allowed_voices else [default_voice]
+        if default_voice not in self.allowed_voices:
+            self.allowed_voices.insert(0, default_voice)
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._engines = OrderedDict()   # voice -> engine, least recently used first
+        self._sizes = {}                # voice -> estimated bytes
+        self._in_use = {}               # voice -> active lease count
+        self._loading = {}              # voice -> Event set when loading finishes
+
+    def resolve_voice(self, voice):
+        """Returns the voice to use, validating it against the allowed list."""
+        voice = voice or self.default_voice
+        if voice not in self.allowed_voices:
+            raise ValueError(f"Unknown voice '{voice}'. Available voices: {', '.join(self.allowed_voices)}")
+        return voice
+
+    def get(self, voice=None):
+        """Returns a loaded engine for ``voice``, loading it if necessary."""
+        voice = self.resolve_voice(voice)
+        while True:
+            with self._lock:
+                if voice in self._engines:
+                    self._engines.move_to_end(voice)
+                    return self._engines[voice]
+                pending = self._loading.get(voice)
+                if pending is None:
+                    pending = self._loading[voice] = threading.Event()
+                    break
+            # Another caller is already loading this voice; wait and share it
+            pending.wait()
+
+        try:
+            print(f"  - Loading TTS voice {voice} ({self.backend} backend)...")
+            engine = self._loader(voice, self.backend)
+            size = estimate_engine_memory(engine)
+            with self._lock:
+                self._engines[voice] = engine
+                self._sizes[voice] = size
+                self._evict_locked(keep=voice)
+            print(f"  - Voice {voice} loaded (~{size / (1024 * 1024):.0f} MB)")
+            return engine
+        finally:
+            with self._lock:
+                self._loading.pop(voice).set()
+
+    @contextmanager
+    def acquire(self, voice=None):
+        """Context manager that pins ``voice`` in memory while it is in use."""
+        voice = self.resolve_voice(voice)
+        with self._lock:
+            self._in_use[voice] = self._in_use.get(voice, 0) + 1
+        try:
+            yield self.get(voice)
+        finally:
+            with self._lock:
+                self._in_use[voice] -= 1
+                if not self._in_use[voice]:
+                    del self._in_use[voice]
+                self._evict_locked()
+
+    def _evict_locked(self, keep=None):
+        """Unloads least recently used idle voices until under the memory budget."""
+        for voice in list(self._engines):
+            if sum(self._sizes.values()) <= self.memory_budget:
+                break
+            if voice == keep or self._in_use.get(voice):
+                continue
+            del self._engines[voice]
+            freed = self._sizes.pop(voice)
+            print(f"  - Unloaded TTS voice {voice} (~{freed / (1024 * 1024):.0f} MB freed)")
+
+    def loaded_voices(self):
+        """Returns the currently loaded voices, most recently used last."""
+        with self._lock:
+            return list(self._engines)
+
+    def memory_usage(self):
+        """Returns the estimated bytes used by loaded voices."""
+        with self._lock:
+            return sum(self._sizes.values())
+
+
+def create_tts_registry_from_env(default_voice=None, backend=None):
+    """Builds a TTSModelRegistry from TTS_* environment variables."""
+    default_voice = default_voice or os.getenv("TTS_MODEL_NAME", DEFAULT_TTS_MODEL)
+    voices = [v.strip() for v in os.getenv("TTS_VOICES", "").split(",") if v.strip()]
+    return TTSModelRegistry(
+        backend=backend or os.getenv("TTS_BACKEND", "pytorch"),
+        memory_budget_mb=float(os.getenv("TTS_MEMORY_BUDGET_MB", DEFAULT_MEMORY_BUDGET_MB)),
+        allowed_voices=voices,
+        default_voice=default_voice,
+    )